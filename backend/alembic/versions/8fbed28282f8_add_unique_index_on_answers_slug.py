@@ -0,0 +1,45 @@
+"""add unique index on answers.slug
+
+Revision ID: 8fbed28282f8
+Revises: ab181a1c679f
+Create Date: 2026-10-14 09:12:31.482913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '8fbed28282f8'
+down_revision = 'ab181a1c679f'
+branch_labels = None
+depends_on = None
+
+# GET /answer/{slug} looks answers up by slug, so the lookup needs an index rather than a seq-scan.
+# The index is unique since a slug identifies exactly one answer.
+INDEX_NAME = 'ix_answers_slug'
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY doesn't lock the table against writes while it builds,
+    # but PostgreSQL refuses to run it inside a transaction block, hence the autocommit block.
+    with op.get_context().autocommit_block():
+        # A concurrent build that failed (e.g. on duplicate slugs, or cancelled) leaves an INVALID
+        # index behind under the same name; drop it so re-running the upgrade retries the build.
+        is_valid = op.get_bind().execute(
+            sa.text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"),
+            {"name": INDEX_NAME},
+        ).scalar()
+        if is_valid is False:
+            op.drop_index(INDEX_NAME, table_name='answers', postgresql_concurrently=True, if_exists=True)
+
+        op.create_index(
+            INDEX_NAME,
+            'answers',
+            ['slug'],
+            unique=True,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(INDEX_NAME, table_name='answers', postgresql_concurrently=True, if_exists=True)
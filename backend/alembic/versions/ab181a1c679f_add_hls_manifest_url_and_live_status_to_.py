@@ -20,8 +20,27 @@ depends_on = None
 # This implies the ENUM type should contain these values after the upgrade.
 ANSWER_STATUS_ENUM_NAME = 'answer_status' # Placeholder name, confirm actual name if it exists
 
+# A migration stuck behind a long-running query would otherwise hold its queued ACCESS EXCLUSIVE
+# lock request indefinitely, blocking every read/write on `answers` queued behind it. Fail fast
+# instead and retry the deploy. These are session settings, so they also cover the autocommit block.
+LOCK_TIMEOUT = '3s'
+STATEMENT_TIMEOUT = '5min'
+
+def _set_timeouts() -> None:
+    op.execute(f"SET lock_timeout = '{LOCK_TIMEOUT}';")
+    op.execute(f"SET statement_timeout = '{STATEMENT_TIMEOUT}';")
+
+def _reset_timeouts() -> None:
+    # Don't leak the timeouts into later migrations running on the same connection
+    op.execute("RESET lock_timeout;")
+    op.execute("RESET statement_timeout;")
+
 def upgrade() -> None:
+    _set_timeouts()
+
     # Add hls_manifest_url column to the answers table
+    # (nullable with no default, so on PG11+ this is a catalog-only change; it still takes a brief
+    # ACCESS EXCLUSIVE lock, which lock_timeout bounds)
     op.add_column('answers', sa.Column('hls_manifest_url', sa.Text(), nullable=True))
 
     # Add 'LIVE' value to the existing ENUM type for the status column.
@@ -40,20 +59,37 @@ def upgrade() -> None:
     # Attempt to create the type with initial values if it doesn't exist. This is usually done in an earlier migration.
     # For this specific migration, we are *extending* an existing setup.
     # So, the type 'answer_status' with 'PENDING', 'READY', 'ERROR' is assumed to exist.
-    op.execute(f"ALTER TYPE {ANSWER_STATUS_ENUM_NAME} ADD VALUE IF NOT EXISTS 'LIVE';")
+    #
+    # ALTER TYPE ... ADD VALUE can't run inside a transaction block before PostgreSQL 12, and even
+    # on 12+ it shouldn't share a transaction with other DDL. Run it in its own autocommit block;
+    # the column add above is committed first.
+    with op.get_context().autocommit_block():
+        op.execute(f"ALTER TYPE {ANSWER_STATUS_ENUM_NAME} ADD VALUE IF NOT EXISTS 'LIVE';")
+
+    _reset_timeouts()
 
 def downgrade() -> None:
+    _set_timeouts()
+
     # Remove the hls_manifest_url column
     op.drop_column('answers', 'hls_manifest_url')
 
-    # Downgrading ENUM types by removing a value ('LIVE') is complex and risky, 
-    # especially if data uses this value. It can also cause issues if other parts of the 
-    # application expect 'LIVE' to be a valid enum member after a failed upgrade and subsequent downgrade.
-    # A common approach is to convert 'LIVE' values to a safe default (e.g., 'ERROR') 
-    # before attempting to alter/recreate the ENUM type without 'LIVE'.
-    # Given the complexity and potential for data loss or application errors, 
-    # this part of the downgrade is often omitted or handled with extreme care (and manual steps).
-    # For this task, the ENUM downgrade for removing 'LIVE' is not implemented to prevent such issues.
-    # If a full rollback of the 'LIVE' status is required, it would need a more detailed strategy.
-    pass
+    # PostgreSQL can't drop a value from an ENUM, so swap in a type without 'LIVE':
+    # rename the current type, recreate the original one, move LIVE answers to ERROR,
+    # cast the column over and drop the old type. The column default has to be dropped
+    # while the type changes since it can't be cast automatically.
+    # All of this runs in the migration's transaction, so a failure at any step rolls
+    # the whole swap back instead of leaving two half-migrated types behind.
+    old_enum_name = f"{ANSWER_STATUS_ENUM_NAME}_old"
+    op.execute(f"ALTER TYPE {ANSWER_STATUS_ENUM_NAME} RENAME TO {old_enum_name};")
+    op.execute(f"CREATE TYPE {ANSWER_STATUS_ENUM_NAME} AS ENUM ('PENDING', 'READY', 'ERROR');")
+    op.execute("UPDATE answers SET status = 'ERROR' WHERE status = 'LIVE';")
+    op.execute("ALTER TABLE answers ALTER COLUMN status DROP DEFAULT;")
+    op.execute(
+        f"ALTER TABLE answers ALTER COLUMN status TYPE {ANSWER_STATUS_ENUM_NAME} "
+        f"USING status::text::{ANSWER_STATUS_ENUM_NAME};"
+    )
+    op.execute("ALTER TABLE answers ALTER COLUMN status SET DEFAULT 'READY';")
+    op.execute(f"DROP TYPE {old_enum_name};")
 
+    _reset_timeouts()
@@ -1,12 +1,13 @@
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Response
 from uuid import UUID
 from typing import List, Optional, Dict, Any
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 import logging
 
 # Assuming the service is in app.services.publish_answer
 # Adjust import path based on actual project structure
-from app.services.publish_answer import publish_answer, AnswerStatus # Assuming AnswerStatus is also exposed or defined there
+from app.services.publish_answer import publish_answer, check_publishable, AnswerStatus # Assuming AnswerStatus is also exposed or defined there
+from app.services.answer_cache import get_cached_answer, cache_answer
 # Placeholder for DB interactions or models for fetching answer and citations
 # from app.db.models import Answer as DBAnswer, Citation as DBCitation # Example
 # from app.db.session import get_session # Example
@@ -21,13 +22,18 @@ class PublishVideoResponse(BaseModel):
     url: Optional[str] = None
     message: Optional[str] = None
 
+# Both models can be validated straight from a dict or an ORM row (from_attributes).
 class CitationItem(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     video_id: str       # YouTube video ID
     start_sec: int      # Start time of the citation in seconds
     text: str           # The cited text snippet
     # end_sec: int      # Optional: if needed by frontend, based on Chunk model
 
 class AnswerResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: UUID
     slug: str # Assuming slug is part of the answer data
     title: str # Assuming title is part of the answer data
@@ -48,43 +54,59 @@ _db_citations: Dict[UUID, List[Dict[str, Any]]] = {}
 
 async def get_answer_by_slug_from_db(slug: str) -> Optional[Dict[str, Any]]:
     logger.warning(f"DB Interaction: get_answer_by_slug_from_db(\"{slug}\") - Using placeholder.")
+    # Real implementation: a single lookup on the unique ix_answers_slug index (migration 8fbed28282f8),
+    # with citations loaded by one SELECT ... WHERE answer_id IN (...) instead of a lazy load per citation.
+    # async with get_session() as session:
+    #     result = await session.execute(
+    #         select(DBAnswer).where(DBAnswer.slug == slug).options(selectinload(DBAnswer.citations))
+    #     )
+    #     return result.scalar_one_or_none()
     for answer_id, answer_data in _db_answers.items():
         if answer_data.get("slug") == slug:
             # Simulate fetching associated citations
-            citations_data = _db_citations.get(answer_id, [])
-            full_answer_data = {**answer_data, "citations": citations_data}
+            citations_data = [
+                {
+                    "video_id": c.get("video_id", "unknown_video_id"), # Ensure video_id is present
+                    "start_sec": c.get("start_sec", 0),
+                    "text": c.get("text", ""),
+                }
+                for c in _db_citations.get(answer_id, [])
+            ]
+            # The placeholder rows may be incomplete; fill in what a real row would always carry.
+            full_answer_data = {
+                "title": "Untitled Answer",
+                "status": AnswerStatus.PENDING,
+                "created_at": "", # Placeholder
+                "updated_at": "", # Placeholder
+                **answer_data,
+                "id": answer_id,
+                "slug": slug,
+                "citations": citations_data,
+            }
             return full_answer_data
     return None
 
 # --- API Endpoints --- #
 
-@router.post("/publish-video/{answer_id}", response_model=PublishVideoResponse)
+@router.post("/publish-video/{answer_id}", response_model=PublishVideoResponse, status_code=202)
 async def api_publish_video(answer_id: UUID, background_tasks: BackgroundTasks):
     """
-    Endpoint to trigger the HLS packaging and R2 upload process for an answer.
+    Endpoint to queue the HLS packaging and R2 upload process for an answer.
+    Pre-flight checks run inline so 404/409/413 are returned synchronously; packaging and
+    upload run after the response has been sent. Clients poll GET /answer/{slug} for the
+    status transition to LIVE (or ERROR).
     """
     logger.info(f"API call to publish video for answer_id: {answer_id}")
-    
-    # In a real scenario with long tasks, you might add it to a background queue.
-    # For now, directly calling the async service.
-    # background_tasks.add_task(publish_answer, answer_id) 
-    # return {"status": "QUEUED", "message": f"Publishing process for answer {answer_id} has been queued."}
-    
-    result = await publish_answer(answer_id)
-    
-    response_status_code = 200
-    if result["status"] == AnswerStatus.ERROR:
-        if result.get("code") == 413: # Payload too large
-            raise HTTPException(status_code=413, detail=result.get("message", "Payload too large"))
-        # Check for specific message indicating "not in READY state"
-        if "not in READY state" in result.get("message", "").lower():
-             raise HTTPException(status_code=409, detail=result.get("message", "Answer not in READY state."))
-        # For other errors from the service, return 500 or a more specific code if available
-        # The service currently returns a generic RuntimeError message
-        raise HTTPException(status_code=500, detail=result.get("message", "Publishing failed due to an internal error."))
-    
-    # If LIVE, status is 200 OK (default)
-    return PublishVideoResponse(status=result["status"], url=result.get("url"), message=result.get("message"))
+
+    check_result = await check_publishable(answer_id)
+    if check_result["status"] == AnswerStatus.ERROR:
+        raise HTTPException(
+            status_code=check_result.get("code", 500),
+            detail=check_result.get("message", "Publishing failed due to an internal error."),
+        )
+
+    background_tasks.add_task(publish_answer, answer_id)
+    return PublishVideoResponse(status="QUEUED", message=f"Publishing process for answer {answer_id} has been queued.")
 
 @router.get("/answer/{slug}", response_model=AnswerResponse)
 async def api_get_answer_by_slug(slug: str):
@@ -92,38 +114,27 @@ async def api_get_answer_by_slug(slug: str):
     Retrieves answer details by slug, including HLS URL and citations.
     """
     logger.info(f"API call to get answer by slug: {slug}")
+
+    # LIVE answers are served from the in-process cache until their status changes. The cache
+    # holds the serialized body, so a hit skips response-model validation and serialization.
+    cached_body = get_cached_answer(slug)
+    if cached_body is not None:
+        return Response(content=cached_body, media_type="application/json")
     
     # Placeholder: Fetch answer from DB
     # This would involve a proper ORM call in a real application
     answer_data_from_db = await get_answer_by_slug_from_db(slug)
     
     if not answer_data_from_db:
-        raise HTTPException(status_code=404, detail=f"Answer with slug ások"{slug}\" not found.")
-
-    # Transform DB citations to API model
-    api_citations = [
-        CitationItem(
-            video_id=c.get("video_id", "unknown_video_id"), # Ensure video_id is present
-            start_sec=c.get("start_sec", 0),
-            text=c.get("text", "")
-        )
-        for c in answer_data_from_db.get("citations", [])
-    ]
-    
-    # Construct the response using the Pydantic model
-    # Ensure all required fields for AnswerResponse are present in answer_data_from_db
-    # or provide defaults.
-    return AnswerResponse(
-        id=answer_data_from_db.get("id", UUID("00000000-0000-0000-0000-000000000000")), # Default for safety
-        slug=slug,
-        title=answer_data_from_db.get("title", "Untitled Answer"),
-        status=answer_data_from_db.get("status", AnswerStatus.PENDING),
-        hls_manifest_url=answer_data_from_db.get("hls_manifest_url"),
-        video_url=answer_data_from_db.get("video_url"), # Should be same as hls_manifest_url for now
-        citations=api_citations,
-        created_at=answer_data_from_db.get("created_at", ""), # Placeholder
-        updated_at=answer_data_from_db.get("updated_at", "")  # Placeholder
-    )
+        raise HTTPException(status_code=404, detail=f"Answer with slug \"{slug}\" not found.")
+
+    # Validated in one pass, citations included; with a real ORM row (citations eager-loaded)
+    # this reads the attributes directly.
+    response = AnswerResponse.model_validate(answer_data_from_db)
+
+    if response.status == AnswerStatus.LIVE:
+        cache_answer(slug, response.id, response.model_dump_json().encode())
+    return response
 
 # To make this runnable, you would typically include this router in your main FastAPI app.
 # Example (in main.py):
@@ -5,21 +5,9 @@ import os
 import sys
 from uuid import UUID
 
-# Add the backend directory to sys.path to allow imports from app
-# This assumes the script is in vizlo/backend/scripts/
-# and the app module is in vizlo/backend/app/
-SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-BACKEND_DIR = os.path.dirname(SCRIPT_DIR) # This should be /home/ubuntu/vizlo/backend
-if BACKEND_DIR not in sys.path:
-    sys.path.insert(0, BACKEND_DIR)
-
-try:
-    from app.services.publish_answer import publish_answer, AnswerStatus
-except ImportError as e:
-    print(f"Error: Could not import publish_answer service. Ensure PYTHONPATH is set correctly or run from project root.")
-    print(f"Current sys.path: {sys.path}")
-    print(f"Details: {e}")
-    sys.exit(1)
+# Run from the backend directory as a module, so `app` resolves without touching sys.path:
+#   python -m app.scripts.dev_publish_answer --answer_id <uuid>
+from app.services.publish_answer import publish_answer, AnswerStatus
 
 logging.basicConfig(
     level=logging.INFO,
@@ -80,15 +68,19 @@ async def main():
     except Exception as e:
         logger.error(f"An unexpected error occurred while running the publish script for {answer_id}: {e}", exc_info=True)
 
+def main_sync():
+    """Synchronous entry point, e.g. for a console-script declaration."""
+    asyncio.run(main())
+
 if __name__ == "__main__":
     # Example of how to run for local dev if env vars are in a .env file
     # from dotenv import load_dotenv
-    # DOTENV_PATH = os.path.join(BACKEND_DIR, ".env") # Assuming .env is in backend directory
+    # DOTENV_PATH = ".env" # Assuming .env is in the backend directory
     # if os.path.exists(DOTENV_PATH):
     #     load_dotenv(DOTENV_PATH)
     #     logger.info(f"Loaded environment variables from {DOTENV_PATH}")
     # else:
     #     logger.info(f".env file not found at {DOTENV_PATH}, relying on system environment variables.")
 
-    asyncio.run(main())
+    main_sync()
 
@@ -0,0 +1,38 @@
+import logging
+from typing import Optional
+from uuid import UUID
+
+from app.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Response cache for GET /answer/{slug}: the serialized JSON body, keyed by slug.
+# Only LIVE answers are cached: they don't change until their status does, so they can be
+# held for a day. Non-LIVE answers are polled by the player for status transitions, and the
+# transition may happen in another worker process, so they are always read fresh.
+# The cache is per process: invalidate_answer() only drops the entry in the process that calls
+# it, so another worker can keep serving its copy of a LIVE answer until the TTL runs out.
+LIVE_ANSWER_TTL_SECONDS = 24 * 60 * 60
+CACHE_MAX_ENTRIES = 4096
+
+# slug -> (answer_id, body). The answer id is stored with the body rather than in a second
+# cache so the two can't be evicted separately, which would leave a body invalidation can't find.
+_responses_by_slug = TTLCache(maxsize=CACHE_MAX_ENTRIES, ttl=LIVE_ANSWER_TTL_SECONDS)
+
+def get_cached_answer(slug: str) -> Optional[bytes]:
+    entry = _responses_by_slug.get(slug)
+    return None if entry is None else entry[1]
+
+def cache_answer(slug: str, answer_id: UUID, body: bytes) -> None:
+    _responses_by_slug.set(slug, (answer_id, body))
+
+def invalidate_answer(answer_id: UUID) -> None:
+    """Drops the cached response for an answer, e.g. after its status changed."""
+    # A scan over at most CACHE_MAX_ENTRIES entries; status changes are rare next to reads.
+    for slug, (cached_answer_id, _) in _responses_by_slug.items():
+        if cached_answer_id == answer_id:
+            _responses_by_slug.pop(slug)
+            logger.debug(f"Invalidated cached answer response for slug {slug}")
+
+def clear_answer_cache() -> None:
+    _responses_by_slug.clear()
@@ -1,10 +1,12 @@
 
 import asyncio
 import logging
+import os
 from pathlib import Path
 import shutil
 import tempfile
 from uuid import UUID
+from typing import Optional
 from datetime import datetime, timezone
 
 # Assuming DB models and session are available. This will need to be adjusted based on actual project structure.
@@ -13,9 +15,42 @@ from datetime import datetime, timezone
 
 from app.workers.hls_packager import package_to_hls
 from app.workers.uploader import upload_dir_to_r2
+from app.services.answer_cache import invalidate_answer
 
 logger = logging.getLogger(__name__)
 
+# Concurrent publishes are capped per stage: packaging is CPU-bound and uploading is network-bound,
+# so separate limits let one answer's upload overlap the next answer's encode without either
+# stage oversubscribing its resource. Each ffmpeg already spreads over all cores (-threads 0),
+# hence the low encode default.
+HLS_ENCODE_CONCURRENCY = int(os.getenv("HLS_ENCODE_CONCURRENCY", "2"))
+HLS_UPLOAD_CONCURRENCY = int(os.getenv("HLS_UPLOAD_CONCURRENCY", "8"))
+_encode_semaphore = asyncio.Semaphore(HLS_ENCODE_CONCURRENCY)
+_upload_semaphore = asyncio.Semaphore(HLS_UPLOAD_CONCURRENCY)
+
+# HLS segments only live between packaging and upload, so they're written to tmpfs where available
+# (/dev/shm on Linux) instead of disk. Docker gives containers a 64MB /dev/shm unless run with
+# --shm-size (e.g. --shm-size=1g, or shm_size in compose), which is too small for a long answer's
+# segments, so /dev/shm is only used while it has HLS_SHM_MIN_FREE_BYTES free; otherwise the output
+# goes to the regular temp dir. HLS_TMP_DIR pins the location and skips the check.
+HLS_TMP_DIR = os.getenv("HLS_TMP_DIR")
+HLS_SHM_DIR = "/dev/shm"
+HLS_SHM_MIN_FREE_BYTES = int(os.getenv("HLS_SHM_MIN_FREE_BYTES", str(512 * 1024 * 1024)))
+
+def _hls_tmp_dir() -> Optional[str]:
+    """Parent dir for a publish's HLS output; None means tempfile.gettempdir()."""
+    if HLS_TMP_DIR:
+        return HLS_TMP_DIR
+    try:
+        if shutil.disk_usage(HLS_SHM_DIR).free >= HLS_SHM_MIN_FREE_BYTES:
+            return HLS_SHM_DIR
+    except OSError: # No /dev/shm (non-Linux)
+        pass
+    return None
+
+# Strong references to in-flight cleanup tasks, so they aren't garbage-collected before finishing.
+_cleanup_tasks: set = set()
+
 # Placeholder for AnswerStatus Enum if not imported from models
 class AnswerStatus:
     READY = "READY"
@@ -36,25 +71,65 @@ async def get_answer_by_id(answer_id: UUID):
 async def update_answer_status_and_url(answer_id: UUID, status: str, hls_url: str = None, video_url: str = None):
     # Placeholder: Simulate updating an answer. Replace with actual DB query.
     logger.warning(f"DB Interaction: update_answer_status_and_url({answer_id}, status={status}, hls_url={hls_url}) - Using placeholder.")
+    # Only LIVE answers are cached, so this is what can leave a stale entry behind: a LIVE answer
+    # moved to another status (e.g. ERROR, or un-published).
+    invalidate_answer(answer_id)
     # Simulate success
     return True
 
-async def publish_answer(answer_id: UUID):
+async def mark_answer_live(answer_id: UUID, hls_url: str) -> bool:
     """
-    Orchestrates the process of packaging an MP4 answer to HLS, uploading it to R2,
-    and updating the answer's status and URLs in the database.
+    Moves an answer from READY to LIVE with its HLS URL in a single conditional UPDATE.
+    Returns False if the answer is missing or no longer READY, i.e. it changed while publishing.
+    """
+    # Placeholder: Simulate the conditional update. Replace with actual DB query.
+    # async with get_session() as session:
+    #     result = await session.execute(
+    #         text(
+    #             "UPDATE answers SET status = 'LIVE', hls_manifest_url = :url, video_url = :url, updated_at = now() "
+    #             "WHERE id = :id AND status = 'READY' RETURNING id"
+    #         ),
+    #         {"url": hls_url, "id": answer_id},
+    #     )
+    #     await session.commit()
+    #     return result.first() is not None
+    logger.warning(f"DB Interaction: mark_answer_live({answer_id}, hls_url={hls_url}) - Using placeholder.")
+    return True
+
+async def mark_answer_failed(answer_id: UUID) -> bool:
+    """
+    Moves an answer from READY to ERROR in a single conditional UPDATE, the failure-side twin of
+    mark_answer_live. Returns False if the answer is no longer READY, e.g. a concurrent publish
+    already made it LIVE; that answer is left as it is.
+    """
+    # Placeholder: Simulate the conditional update. Replace with actual DB query.
+    # async with get_session() as session:
+    #     result = await session.execute(
+    #         text("UPDATE answers SET status = 'ERROR', updated_at = now() WHERE id = :id AND status = 'READY' RETURNING id"),
+    #         {"id": answer_id},
+    #     )
+    #     await session.commit()
+    #     return result.first() is not None
+    logger.warning(f"DB Interaction: mark_answer_failed({answer_id}) - Using placeholder.")
+    return True
+
+async def _fail_publish(answer_id: UUID) -> None:
+    if not await mark_answer_failed(answer_id): # Placeholder
+        logger.warning(f"Answer {answer_id} was no longer READY when its publish failed; leaving its status unchanged.")
+
+async def check_publishable(answer_id: UUID) -> dict:
+    """
+    Pre-flight checks for publishing an answer: it exists, is READY, and its MP4 is present
+    and within the size limit. Cheap enough to run inline in the API request, so problems
+    are reported synchronously before any packaging work is queued.
 
     Args:
         answer_id: The UUID of the answer to publish.
 
     Returns:
-        A dictionary with status and optionally the public HLS URL.
-        e.g., {"status": "LIVE", "url": "https://cdn.example.com/answers/.../master.m3u8"}
-              {"status": "ERROR", "message": "..."}
-              {"status": "QUEUED"} (if a background task system were used, not directly applicable here)
+        {"status": "READY", "mp4_path": Path(...)} if the answer can be published, otherwise
+        {"status": "ERROR", "message": "...", "code": <HTTP status for the API layer>}.
     """
-    logger.info(f"Attempting to publish answer_id: {answer_id}")
-
     # 1. Verify answer status (using placeholder DB interaction)
     # In a real app, this would use an async DB session
     # async with get_session() as session:
@@ -63,86 +138,114 @@ async def publish_answer(answer_id: UUID):
 
     if not answer_data:
         logger.error(f"Answer with ID {answer_id} not found.")
-        return {"status": AnswerStatus.ERROR, "message": f"Answer with ID {answer_id} not found."}
+        return {"status": AnswerStatus.ERROR, "message": f"Answer with ID {answer_id} not found.", "code": 404}
 
     if answer_data.get("status") != AnswerStatus.READY:
         logger.warning(f"Answer {answer_id} is not in READY state. Current status: {answer_data.get('status')}")
-        return {"status": AnswerStatus.ERROR, "message": f"Answer {answer_id} is not in READY state (current: {answer_data.get('status')}). Cannot publish."}
+        return {"status": AnswerStatus.ERROR, "message": f"Answer {answer_id} is not in READY state (current: {answer_data.get('status')}). Cannot publish.", "code": 409}
 
     mp4_file_path_str = answer_data.get("mp4_path", f"/media/answers/{answer_id}.mp4")
     mp4_file_path = Path(mp4_file_path_str)
 
-    if not mp4_file_path.exists():
+    # One stat() covers both the existence and the size check. It runs in a thread since media may
+    # live on a network filesystem, where stat can block the event loop for a noticeable time.
+    try:
+        mp4_stat = await asyncio.to_thread(mp4_file_path.stat)
+    except FileNotFoundError:
         logger.error(f"MP4 file for answer {answer_id} not found at {mp4_file_path}")
-        await update_answer_status_and_url(answer_id, AnswerStatus.ERROR) # Placeholder update
-        return {"status": AnswerStatus.ERROR, "message": f"MP4 file not found at {mp4_file_path}"}
-    
+        await _fail_publish(answer_id)
+        return {"status": AnswerStatus.ERROR, "message": f"MP4 file not found at {mp4_file_path}", "code": 500}
+
     # MP4 size check (as per edge cases)
-    # This check should ideally be in the service or API layer before calling this.
-    # For now, let's assume it's handled or add a basic check here.
-    mp4_size_mb = mp4_file_path.stat().st_size / (1024 * 1024)
+    mp4_size_mb = mp4_stat.st_size / (1024 * 1024)
     if mp4_size_mb > 20:
         logger.error(f"MP4 file {mp4_file_path} for answer {answer_id} is too large: {mp4_size_mb:.2f} MB (max 20 MB).")
-        # Not changing status to ERROR here as per task, but returning 413 from API layer is mentioned.
-        # This service might just propagate the error or the API layer handles it.
+        # Not changing status to ERROR here as per task; the API layer returns 413.
         return {"status": AnswerStatus.ERROR, "message": "Payload too large", "code": 413}
 
+    return {"status": AnswerStatus.READY, "mp4_path": mp4_file_path}
+
+async def publish_answer(answer_id: UUID):
+    """
+    Orchestrates the process of packaging an MP4 answer to HLS, uploading it to R2,
+    and updating the answer's status and URLs in the database.
+    The API runs this as a background task after check_publishable has passed; the checks
+    are repeated here since the answer may have changed in between, and for direct callers.
+
+    Args:
+        answer_id: The UUID of the answer to publish.
+
+    Returns:
+        A dictionary with status and optionally the public HLS URL.
+        e.g., {"status": "LIVE", "url": "https://cdn.example.com/answers/.../master.m3u8"}
+              {"status": "ERROR", "message": "...", "code": 409}
+    """
+    logger.info(f"Attempting to publish answer_id: {answer_id}")
+
+    check_result = await check_publishable(answer_id)
+    if check_result["status"] != AnswerStatus.READY:
+        return check_result
+    mp4_file_path = check_result["mp4_path"]
+
     temp_hls_dir = None
     try:
         # 2. Create a temporary directory for HLS output
-        temp_hls_dir_path_obj = tempfile.mkdtemp(prefix=f"hls_{answer_id}_")
+        temp_hls_dir_path_obj = tempfile.mkdtemp(prefix=f"hls_{answer_id}_", dir=_hls_tmp_dir())
         temp_hls_dir = Path(temp_hls_dir_path_obj)
         logger.info(f"Created temporary HLS directory: {temp_hls_dir}")
 
         # 3. Call HLS Packager
         logger.info(f"Starting HLS packaging for {mp4_file_path}...")
-        master_manifest_path = await package_to_hls(mp4_file_path, temp_hls_dir)
+        async with _encode_semaphore:
+            master_manifest_path = await package_to_hls(mp4_file_path, temp_hls_dir)
         logger.info(f"HLS packaging complete. Master manifest: {master_manifest_path}")
 
         # 4. Call R2 Uploader
         remote_r2_prefix = f"answers/{answer_id}"
         logger.info(f"Starting upload of HLS files from {temp_hls_dir} to R2 prefix {remote_r2_prefix}...")
-        public_hls_url = await upload_dir_to_r2(temp_hls_dir, remote_r2_prefix)
+        async with _upload_semaphore:
+            public_hls_url = await upload_dir_to_r2(temp_hls_dir, remote_r2_prefix)
         logger.info(f"Upload to R2 complete. Public HLS URL: {public_hls_url}")
 
         # 5. Update database (using placeholder DB interaction)
-        # async with get_session() as session:
-        #     answer_to_update = await session.get(Answer, answer_id)
-        #     if answer_to_update:
-        #         answer_to_update.hls_manifest_url = public_hls_url
-        #         answer_to_update.video_url = public_hls_url # As per spec, video_url is same as manifest for now
-        #         answer_to_update.status = AnswerStatus.LIVE
-        #         answer_to_update.updated_at = datetime.now(timezone.utc)
-        #         await session.commit()
-        #         logger.info(f"Answer {answer_id} status updated to LIVE. HLS URL: {public_hls_url}")
-        #     else:
-        #         logger.error(f"Failed to find answer {answer_id} in DB for final update.")
-        #         raise RuntimeError(f"Answer {answer_id} disappeared during processing.")
-        await update_answer_status_and_url(answer_id, AnswerStatus.LIVE, hls_url=public_hls_url, video_url=public_hls_url) # Placeholder
+        # READY -> LIVE is one conditional UPDATE: no re-read, and an answer whose status changed
+        # since check_publishable (e.g. a concurrent publish) isn't overwritten.
+        if not await mark_answer_live(answer_id, public_hls_url): # Placeholder
+            logger.warning(f"Answer {answer_id} was no longer READY when publishing finished; not marking it LIVE.")
+            return {"status": AnswerStatus.ERROR, "message": f"Answer {answer_id} is no longer in READY state. Not published.", "code": 409}
         logger.info(f"Answer {answer_id} status updated to LIVE. HLS URL: {public_hls_url}")
 
         return {"status": AnswerStatus.LIVE, "url": public_hls_url}
 
     except FileNotFoundError as e:
         logger.error(f"Publishing error for {answer_id} (FileNotFound): {e}")
-        await update_answer_status_and_url(answer_id, AnswerStatus.ERROR) # Placeholder
+        await _fail_publish(answer_id)
         return {"status": AnswerStatus.ERROR, "message": str(e)}
     except RuntimeError as e:
         logger.error(f"Publishing error for {answer_id} (RuntimeError): {e}", exc_info=True)
-        await update_answer_status_and_url(answer_id, AnswerStatus.ERROR) # Placeholder
+        await _fail_publish(answer_id)
         return {"status": AnswerStatus.ERROR, "message": str(e)}
     except Exception as e:
         logger.error(f"Unexpected error during publishing of answer {answer_id}: {e}", exc_info=True)
-        await update_answer_status_and_url(answer_id, AnswerStatus.ERROR) # Placeholder
+        await _fail_publish(answer_id)
         return {"status": AnswerStatus.ERROR, "message": f"An unexpected error occurred: {str(e)}"}
     finally:
         # 6. Clean up temporary HLS directory
-        if temp_hls_dir and temp_hls_dir.exists():
-            try:
-                shutil.rmtree(temp_hls_dir)
-                logger.info(f"Successfully cleaned up temporary HLS directory: {temp_hls_dir}")
-            except Exception as e:
-                logger.error(f"Error cleaning up temporary HLS directory {temp_hls_dir}: {e}", exc_info=True)
+        # Removing every segment is a lot of blocking unlinks, so it runs in a thread without
+        # holding up the publish result.
+        if temp_hls_dir:
+            task = asyncio.create_task(asyncio.to_thread(_remove_temp_dir, temp_hls_dir))
+            _cleanup_tasks.add(task)
+            task.add_done_callback(_cleanup_tasks.discard)
+
+def _remove_temp_dir(temp_hls_dir: Path):
+    if not temp_hls_dir.exists():
+        return
+    try:
+        shutil.rmtree(temp_hls_dir)
+        logger.info(f"Successfully cleaned up temporary HLS directory: {temp_hls_dir}")
+    except Exception as e:
+        logger.error(f"Error cleaning up temporary HLS directory {temp_hls_dir}: {e}", exc_info=True)
 
 # Example usage (for local testing, not part of the service itself)
 # async def main_publish_example():
@@ -0,0 +1,74 @@
+import functools
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List, Optional, Tuple
+
+class TTLCache:
+    """
+    Small in-process LRU cache whose entries expire `ttl` seconds after they are set.
+    Not thread-safe; meant to be used from a single event loop.
+    """
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            return default
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def items(self) -> List[Tuple[Hashable, Any]]:
+        """Snapshot of the unexpired (key, value) pairs, least recently used first."""
+        now = time.monotonic()
+        return [(key, value) for key, (expires_at, value) in self._data.items() if expires_at > now]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+def async_ttl_cache(
+    maxsize: int = 1024,
+    ttl: float = 300.0,
+    ttl_for: Optional[Callable[[Any], Optional[float]]] = None,
+) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """
+    Decorator that caches an async function's results in a TTLCache, keyed on its arguments.
+    `ttl_for(result)` may return a different TTL for a particular result (None keeps `ttl`).
+    Exceptions are not cached. The wrapper exposes cache_clear().
+    """
+    def decorator(fn: Callable[..., Any]) -> Callable[..., Any]:
+        cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        missing = object()
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items()))) if kwargs else args
+            result = cache.get(key, missing)
+            if result is missing:
+                result = await fn(*args, **kwargs)
+                cache.set(key, result, ttl_for(result) if ttl_for else None)
+            return result
+
+        wrapper.cache_clear = cache.clear
+        return wrapper
+
+    return decorator
@@ -1,5 +1,5 @@
 import asyncio, random, time, functools
-from typing import Tuple, Type, Callable, Any
+from typing import Tuple, Type, Callable, Any, Optional
 
 def retry_backoff(
     errors: Tuple[Type[Exception], ...] = (Exception,),
@@ -12,33 +12,37 @@ def retry_backoff(
     Works for both sync and async callables.
     """
     def decorator(fn: Callable[..., Any]) -> Callable[..., Any]:
-        is_coro = asyncio.iscoroutinefunction(fn)
+        # Waits are fixed at decoration time: first_wait, 2*first_wait, 4*first_wait, ...
+        # The trailing None marks the last attempt, whose error is re-raised. max_retries <= 0
+        # leaves the schedule empty, so (as before) fn is never called and the wrapper returns None.
+        schedule: Tuple[Optional[float], ...] = ()
+        if max_retries > 0:
+            schedule = tuple(first_wait * (1 << i) for i in range(max_retries - 1)) + (None,)
+        wrap = _retry_async if asyncio.iscoroutinefunction(fn) else _retry_sync
+        return functools.wraps(fn)(wrap(fn, errors, schedule, jitter))
 
-        async def _async(*args, **kwargs):
-            delay = first_wait
-            for attempt in range(max_retries):
-                try:
-                    return await fn(*args, **kwargs)
-                except errors:
-                    if attempt == max_retries - 1:
-                        raise
-                    wait = delay + random.uniform(0, delay * 0.1) if jitter else delay
-                    await asyncio.sleep(wait)
-                    delay *= 2
+    return decorator
 
-        def _sync(*args, **kwargs):
-            delay = first_wait
-            for attempt in range(max_retries):
-                try:
-                    return fn(*args, **kwargs)
-                except errors:
-                    if attempt == max_retries - 1:
-                        raise
-                    wait = delay + random.uniform(0, delay * 0.1) if jitter else delay
-                    time.sleep(wait)
-                    delay *= 2
+def _retry_async(fn, errors, schedule: Tuple[Optional[float], ...], jitter: bool):
+    async def _async(*args, **kwargs):
+        for base in schedule:
+            try:
+                return await fn(*args, **kwargs)
+            except errors:
+                if base is None:
+                    raise
+            await asyncio.sleep(base + random.random() * base * 0.1 if jitter else base)
 
-        return functools.wraps(fn)(_async if is_coro else _sync)
+    return _async
 
-    return decorator
+def _retry_sync(fn, errors, schedule: Tuple[Optional[float], ...], jitter: bool):
+    def _sync(*args, **kwargs):
+        for base in schedule:
+            try:
+                return fn(*args, **kwargs)
+            except errors:
+                if base is None:
+                    raise
+            time.sleep(base + random.random() * base * 0.1 if jitter else base)
 
+    return _sync
@@ -1,13 +1,136 @@
 import asyncio
+from collections import OrderedDict
+import json
 import logging
+import os
 from pathlib import Path
 import shutil
+from typing import Any, Dict, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+class _LazyJoin:
+    """Joins `parts` with spaces only when formatted, e.g. by a log record that is actually emitted."""
+    __slots__ = ("parts",)
+
+    def __init__(self, parts):
+        self.parts = parts
+
+    def __str__(self) -> str:
+        return " ".join(self.parts)
+
+# Speed preset per supported encoder; None means the encoder takes no -preset (videotoolbox).
+_ENCODER_PRESETS: Dict[str, Optional[str]] = {
+    "libx264": "veryfast",
+    "h264_nvenc": "p4",
+    "h264_qsv": "veryfast",
+    "h264_videotoolbox": None,
+}
+
+def _resolve_video_encoder() -> str:
+    """
+    Reads HLS_VIDEO_ENCODER. An encoder we have no settings for (a typo, or e.g. "libx265",
+    which wouldn't produce H.264 at all) falls back to libx264 with a warning rather than
+    failing every publish at ffmpeg time.
+    """
+    encoder = os.getenv("HLS_VIDEO_ENCODER", "libx264")
+    if encoder not in _ENCODER_PRESETS:
+        logger.warning(
+            "Unsupported HLS_VIDEO_ENCODER %r (expected one of %s), using libx264",
+            encoder, ", ".join(_ENCODER_PRESETS),
+        )
+        return "libx264"
+    return encoder
+
+# Video encoder for the HLS re-encode. libx264 works everywhere; hosts with a GPU/iGPU
+# can opt into a hardware encoder (h264_nvenc, h264_qsv, h264_videotoolbox).
+HLS_VIDEO_ENCODER = _resolve_video_encoder()
+
+# Inputs inside these limits (H.264 video + AAC audio) are remuxed with -c copy instead of re-encoded.
+# The pixel format and profiles are the ones every HLS player can decode; 10-bit or 4:2:2 H.264
+# (High 10, High 4:2:2) would copy through fine and then fail to play.
+STREAM_COPY_MAX_HEIGHT = 720
+STREAM_COPY_MAX_VIDEO_BITRATE = 3_200_000
+STREAM_COPY_PIX_FMT = "yuv420p"
+STREAM_COPY_H264_PROFILES = frozenset({"Baseline", "Constrained Baseline", "Main", "High"})
+
+# ffprobe results keyed by (path, mtime_ns, size), so retries of the same publish don't re-probe.
+_PROBE_CACHE_SIZE = 256
+_probe_cache: "OrderedDict[Tuple[str, int, int], Optional[Dict[str, Any]]]" = OrderedDict()
+
+async def _probe(mp4_path: Path) -> Optional[Dict[str, Any]]:
+    """
+    Returns ffprobe's stream info for mp4_path as parsed JSON, or None if it can't be probed.
+    A failed probe is not an error: the caller just falls back to a full re-encode.
+    """
+    # stat can block on slow or network storage just like ffprobe can, so keep it off the loop too.
+    stat_result = await asyncio.to_thread(mp4_path.stat)
+    cache_key = (str(mp4_path), stat_result.st_mtime_ns, stat_result.st_size)
+    if cache_key in _probe_cache:
+        _probe_cache.move_to_end(cache_key)
+        return _probe_cache[cache_key]
+
+    ffprobe_path = shutil.which("ffprobe")
+    if not ffprobe_path:
+        return None
+
+    process = await asyncio.create_subprocess_exec(
+        ffprobe_path,
+        "-v", "error",
+        "-show_entries", "stream=codec_type,codec_name,profile,pix_fmt,height,bit_rate",
+        "-of", "json",
+        str(mp4_path),
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+        close_fds=False,
+    )
+    stdout, _ = await process.communicate()
+
+    probe_result = None
+    if process.returncode == 0:
+        try:
+            probe_result = json.loads(stdout)
+        except ValueError:
+            logger.warning("Could not parse ffprobe output for %s", mp4_path)
+
+    _probe_cache[cache_key] = probe_result
+    if len(_probe_cache) > _PROBE_CACHE_SIZE:
+        _probe_cache.popitem(last=False)
+    return probe_result
+
+def _can_stream_copy(probe_result: Optional[Dict[str, Any]]) -> bool:
+    """True if the probed input is already 8-bit 4:2:0 H.264/AAC within the 720p / 3.2 Mbps HLS target."""
+    if not probe_result:
+        return False
+
+    streams = probe_result.get("streams", [])
+    video_streams = [s for s in streams if s.get("codec_type") == "video"]
+    audio_streams = [s for s in streams if s.get("codec_type") == "audio"]
+    if len(video_streams) != 1:
+        return False
+
+    video = video_streams[0]
+    try:
+        height = int(video.get("height", 0))
+        bit_rate = int(video.get("bit_rate", 0))  # ffprobe reports bit_rate as a string
+    except (TypeError, ValueError):
+        return False
+
+    if video.get("codec_name") != "h264":
+        return False
+    if video.get("pix_fmt") != STREAM_COPY_PIX_FMT or video.get("profile") not in STREAM_COPY_H264_PROFILES:
+        return False
+    if not 0 < height <= STREAM_COPY_MAX_HEIGHT or not 0 < bit_rate <= STREAM_COPY_MAX_VIDEO_BITRATE:
+        return False
+    return all(a.get("codec_name") == "aac" for a in audio_streams)
+
 async def package_to_hls(mp4_path: Path, out_dir: Path) -> Path:
     """
     Transcodes an MP4 file to HLS format (master.m3u8 and .ts segments).
+    Inputs that already match the target profile (yuv420p H.264 Baseline/Main/High + AAC,
+    <=720p, <=3.2 Mbps video)
+    are remuxed with stream copy instead of being re-encoded.
 
     Args:
         mp4_path: Path to the input MP4 file.
@@ -33,14 +156,41 @@ async def package_to_hls(mp4_path: Path, out_dir: Path) -> Path:
     if not ffmpeg_path:
         raise RuntimeError("ffmpeg command not found. Please ensure it is installed and in PATH.")
 
+    if _can_stream_copy(await _probe(mp4_path)):
+        # Input already matches the HLS target profile: remux into TS segments, no re-encode.
+        # -c copy: copy the audio and video streams as-is
+        # -bsf:v h264_mp4toannexb: rewrite H.264 from MP4 (AVCC) framing to the Annex B framing TS expects
+        logger.info("%s already matches the HLS profile, stream-copying instead of re-encoding", mp4_path)
+        input_args = []
+        codec_args = ["-c", "copy", "-bsf:v", "h264_mp4toannexb"]
+    else:
+        video_encoder = HLS_VIDEO_ENCODER
+        preset = _ENCODER_PRESETS.get(video_encoder)
+
+        # -hwaccel auto: (hardware encoders only) decode on the same device when possible
+        # -c:v <encoder>: video codec H.264 (libx264 unless HLS_VIDEO_ENCODER selects a hardware encoder)
+        # -preset: encoder speed preset (veryfast for libx264, p4 for nvenc)
+        # -vf scale=-2:720: scale to 720p height, maintain aspect ratio
+        # -b:v 3M: target video bitrate 3 Mbps (this is average, maxrate could be used for stricter control)
+        # -maxrate 3M -bufsize 6M: (Alternative) for stricter max bitrate control
+        # -c:a aac: audio codec AAC
+        # -b:a 128k: audio bitrate 128 kbps
+        # -threads 0: let ffmpeg pick the thread count from the available cores
+        input_args = ["-hwaccel", "auto"] if video_encoder != "libx264" else []
+        codec_args = [
+            "-c:v", video_encoder,
+            *(["-preset", preset] if preset else []),
+            "-vf", "scale=-2:720",
+            "-b:v", "3M", # Target average bitrate
+            # "-maxrate", "3M", "-bufsize", "6M", # Stricter max bitrate control if needed
+            "-c:a", "aac",
+            "-b:a", "128k",
+            "-threads", "0",
+        ]
+
     # ffmpeg command arguments
+    # -hide_banner -nostats -loglevel error: keep stderr down to actual errors so the pipe stays small
     # -i: input file
-    # -c:v libx264: video codec H.264
-    # -vf scale=-2:720: scale to 720p height, maintain aspect ratio
-    # -b:v 3M: target video bitrate 3 Mbps (this is average, maxrate could be used for stricter control)
-    # -maxrate 3M -bufsize 6M: (Alternative) for stricter max bitrate control
-    # -c:a aac: audio codec AAC
-    # -b:a 128k: audio bitrate 128 kbps
     # -f hls: output format HLS
     # -hls_time 10: segment duration 10 seconds
     # -hls_playlist_type vod: playlist type Video on Demand
@@ -50,13 +200,10 @@ async def package_to_hls(mp4_path: Path, out_dir: Path) -> Path:
     # -y: overwrite output files without asking
     args = [
         ffmpeg_path,
+        "-hide_banner", "-nostats", "-loglevel", "error",
+        *input_args,
         "-i", str(mp4_path),
-        "-c:v", "libx264",
-        "-vf", "scale=-2:720",
-        "-b:v", "3M", # Target average bitrate
-        # "-maxrate", "3M", "-bufsize", "6M", # Stricter max bitrate control if needed
-        "-c:a", "aac",
-        "-b:a", "128k",
+        *codec_args,
         "-f", "hls",
         "-hls_time", "10",
         "-hls_playlist_type", "vod",
@@ -66,27 +213,31 @@ async def package_to_hls(mp4_path: Path, out_dir: Path) -> Path:
         "-y"
     ]
 
-    logger.info(f"Starting HLS packaging for {mp4_path} to {out_dir}")
-    logger.debug(f"ffmpeg command: {" ".join(args)}")
+    logger.info("Starting HLS packaging for %s to %s", mp4_path, out_dir)
+    logger.debug("ffmpeg command: %s", _LazyJoin(args))
 
+    # ffmpeg only reports through stderr (the HLS output goes to files), so that is the one pipe.
+    # stdin=DEVNULL keeps ffmpeg from reading the server's stdin or waiting on a tty.
+    # close_fds=False skips closing every descriptor up to the fd limit in the child; that's safe
+    # because Python creates its descriptors non-inheritable (PEP 446), so nothing extra leaks.
     process = await asyncio.create_subprocess_exec(
         *args,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+        close_fds=False,
     )
 
-    stdout, stderr = await process.communicate()
+    _, stderr = await process.communicate()
 
     if process.returncode != 0:
         error_message = f"ffmpeg failed with exit code {process.returncode}.\n"
-        if stdout:
-            error_message += f"Stdout:\n{stdout.decode(errors='ignore')}\n"
         if stderr:
             error_message += f"Stderr:\n{stderr.decode(errors='ignore')}"
         logger.error(error_message)
         raise RuntimeError(error_message)
 
-    logger.info(f"HLS packaging successful for {mp4_path}. Master manifest: {master_manifest_path}")
+    logger.info("HLS packaging successful for %s. Master manifest: %s", mp4_path, master_manifest_path)
     return master_manifest_path
 
 # Example usage (for testing purposes, not part of the worker itself)
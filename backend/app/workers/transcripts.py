@@ -1,77 +1,98 @@
-from typing import List, NamedTuple
+import asyncio
+from dataclasses import dataclass
+from typing import Iterator, List, Union
+from app.utils.cache import async_ttl_cache
 from app.utils.retry import retry_backoff
 from youtube_transcript_api import YouTubeTranscriptApi
 from youtube_transcript_api._errors import NoTranscriptFound
 import tiktoken
 
-class Chunk(NamedTuple):
+# Slotted rather than a NamedTuple: smaller per instance and quicker to build. Not frozen, since
+# frozen dataclasses assign fields through object.__setattr__, which makes construction slower
+# than the NamedTuple it replaces.
+@dataclass(slots=True)
+class Chunk:
     text: str
     start_sec: int
     end_sec: int
 
 ENCODER = tiktoken.encoding_for_model("text-embedding-3-small")
 
+# A video's captions practically never change, so fetched transcripts are kept for a month.
+# "No transcript" is kept only for a day, so captions added after upload still get picked up.
+CAPTIONS_CACHE_SIZE = 10_000
+CAPTIONS_TTL_SECONDS = 30 * 24 * 60 * 60
+NO_CAPTIONS_TTL_SECONDS = 24 * 60 * 60
+
+@async_ttl_cache(
+    maxsize=CAPTIONS_CACHE_SIZE,
+    ttl=CAPTIONS_TTL_SECONDS,
+    ttl_for=lambda captions: None if captions else NO_CAPTIONS_TTL_SECONDS,
+)
 @retry_backoff(errors=(Exception,), max_retries=5, first_wait=2, jitter=True)
 async def fetch_captions(video_id: str) -> str:
     """Return plain	text caption string (en only)."""
     try:
-        transcript = YouTubeTranscriptApi.get_transcript(video_id, languages=["en"])
+        # get_transcript is a blocking HTTP call; keep it off the event loop
+        transcript = await asyncio.to_thread(YouTubeTranscriptApi.get_transcript, video_id, languages=["en"])
         return " ".join(item["text"] for item in transcript)
     except NoTranscriptFound:
         return ""  # caller will skip video
 
+async def fetch_captions_bulk(video_ids: List[str], concurrency: int = 16) -> List[Union[str, BaseException]]:
+    """
+    Fetch captions for many videos concurrently, at most `concurrency` at a time.
+    Results are in input order; a video whose fetch still fails after retries
+    gets its exception in place of the caption string.
+    """
+    sem = asyncio.Semaphore(concurrency)
+
+    async def _one(video_id: str) -> str:
+        async with sem:
+            return await fetch_captions(video_id)
 
-def chunk(txt: str, max_tokens: int = 400, overlap: int = 50) -> List[Chunk]:
+    return await asyncio.gather(*(_one(v) for v in video_ids), return_exceptions=True)
+
+
+def chunk(txt: str, max_tokens: int = 400, overlap: int = 50) -> Iterator[Chunk]:
     """
-    Splits a text into overlapping chunks based on token count.
+    Splits a text into overlapping chunks based on token count, yielding them one at a time
+    so consumers can stream them into the next stage (use list() for all of them at once).
     Timestamps (start_sec, end_sec) are estimated based on token index
     assuming a rate of 3.2 tokens per second.
     """
-    tokens = ENCODER.encode(txt)
+    # Transcripts are plain text, so the special-token scan done by encode() is wasted work.
+    return _chunk_tokens(ENCODER.encode_ordinary(txt), max_tokens, overlap)
+
+def chunk_batch(texts: List[str], max_tokens: int = 400, overlap: int = 50) -> List[List[Chunk]]:
+    """
+    Same as chunk() for many texts at once, as one list of chunks per text in input order.
+    Tokenization runs on tiktoken's thread pool, which encodes outside the GIL.
+    """
+    all_tokens = ENCODER.encode_ordinary_batch(texts)
+    return [list(_chunk_tokens(tokens, max_tokens, overlap)) for tokens in all_tokens]
+
+def _chunk_tokens(tokens: List[int], max_tokens: int, overlap: int) -> Iterator[Chunk]:
     total_tokens = len(tokens)
 
-    if not total_tokens:
-        return []
-
-    chunks_list: List[Chunk] = []
-    current_pos = 0
-    step = max_tokens - overlap 
-
-    # Guard against non-positive step if multiple chunks would be needed, to prevent infinite loop.
-    # Current tests (max_tokens=400, overlap=50 => step=350) do not hit this.
-    # If step <= 0 and total_tokens > max_tokens, this loop could be infinite without a break.
-
-    while current_pos < total_tokens:
-        end_pos = min(current_pos + max_tokens, total_tokens)
-        chunk_tokens = tokens[current_pos:end_pos]
-
-        if not chunk_tokens: # Should not be reached if current_pos < total_tokens & max_tokens > 0
-            break
-
-        text_content = ENCODER.decode(chunk_tokens)
-        start_sec = int(current_pos / 3.2)
-        
-        # Index of the last token in this specific chunk within the original 'tokens' list
-        last_token_index_in_original = current_pos + len(chunk_tokens) - 1
-        end_sec = int(last_token_index_in_original / 3.2)
-        
-        # Ensure end_sec is not less than start_sec, especially for single token chunks due to int truncation.
-        if end_sec < start_sec:
-            end_sec = start_sec
-
-        chunks_list.append(Chunk(text=text_content, start_sec=start_sec, end_sec=end_sec))
-
-        if end_pos == total_tokens:
-            break # All tokens processed
-
-        # If step is non-positive and we still have tokens beyond the current chunk, 
-        # advancing by step would not progress. Break to avoid infinite loop.
-        if step <= 0 and current_pos + max_tokens < total_tokens:
-            # This implies overlap >= max_tokens, and there's more text that won't be reached.
-            # Effectively, only the first chunk is returned in this scenario.
-            break
-        
-        current_pos += step
-    
-    return chunks_list
+    if not total_tokens or max_tokens <= 0:
+        return
+
+    step = max_tokens - overlap
+    if step > 0:
+        # A chunk starts every `step` tokens until one reaches the end of the text.
+        starts = range(0, max(total_tokens - max_tokens, 0) + step, step)
+    else:
+        # overlap >= max_tokens would never advance past the first chunk, so only that one is yielded.
+        starts = range(1)
+
+    for start_pos in starts:
+        end_pos = min(start_pos + max_tokens, total_tokens)
+        text_content = ENCODER.decode(tokens[start_pos:end_pos])
+
+        # index / 3.2 in integer math; end_sec uses the index of the chunk's last token,
+        # which is never before start_pos, so end_sec >= start_sec.
+        start_sec = start_pos * 10 // 32
+        end_sec = (end_pos - 1) * 10 // 32
 
+        yield Chunk(text=text_content, start_sec=start_sec, end_sec=end_sec)
@@ -1,114 +1,361 @@
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, fields
+import functools
+import hashlib
 import logging
 import os
+import random
+import time
 from pathlib import Path
-import mimetypes
+from typing import Awaitable, Callable, Union
 
 import boto3
-from botocore.exceptions import ClientError, NoCredentialsError
+from boto3.exceptions import S3UploadFailedError
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError, HTTPClientError, NoCredentialsError
+from botocore.exceptions import ConnectionError as BotoConnectionError
 
 logger = logging.getLogger(__name__)
 
-# Default retry configuration
+# Default retry configuration. Waits use "full jitter": a random time up to the exponential
+# backoff, so files that failed together (e.g. on R2 throttling) don't all retry together.
 MAX_RETRIES = 3
-INITIAL_BACKOFF_SECONDS = 1.0
+INITIAL_BACKOFF_SECONDS = 0.1
+MAX_BACKOFF_SECONDS = 8.0
+# Wall-clock budget for one file's attempts and waits together. Slow attempts (timeouts) count
+# too, so a file stuck on a struggling endpoint can't hold the whole directory upload for long.
+MAX_TOTAL_RETRY_SECONDS = float(os.getenv("R2_MAX_TOTAL_RETRY_SECONDS", "60"))
 
-# Known MIME types for HLS
+# S3 error codes worth retrying; anything else (AccessDenied, NoSuchBucket, ...) won't succeed
+# on a second attempt. 5xx and 429 responses are retried whatever their code.
+RETRYABLE_ERROR_CODES = {
+    "SlowDown", "RequestTimeout", "Throttling", "ThrottlingException",
+    "InternalError", "ServiceUnavailable", "500", "502", "503", "504",
+}
+
+# Maximum number of files uploaded at once from a single directory
+R2_UPLOAD_CONCURRENCY = int(os.getenv("R2_UPLOAD_CONCURRENCY", "16"))
+
+# Blocking boto3 calls run on a dedicated pool shared by all publishes, rather than the loop's
+# default executor (also used by every other to_thread call, e.g. caption fetches). Its size
+# caps the uploads in flight across concurrent publishes; by default it matches the client's
+# connection pool.
+R2_UPLOAD_THREADS = int(os.getenv("R2_UPLOAD_THREADS", str(R2_UPLOAD_CONCURRENCY)))
+_upload_executor = ThreadPoolExecutor(max_workers=R2_UPLOAD_THREADS, thread_name_prefix="r2-upload")
+
+# Re-publishing an answer (mostly in development) produces largely byte-identical segments.
+# With this on, each file is HEADed first and skipped when the stored object's ETag already
+# equals the file's (single-part or multipart) ETag. Off by default: on a first publish it's one
+# extra request per file.
+R2_SKIP_UNCHANGED = os.getenv("R2_SKIP_UNCHANGED", "").lower() in ("1", "true", "yes")
+
+# Most HLS segments are a few hundred KB to a few MB and go up in a single PUT. Segments of
+# long answers can reach tens of MB though, and a single PUT can't be parallelized, so from
+# 8MB on a file is split into 8MB parts uploaded concurrently (R2's minimum part size is 5MB).
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    max_concurrency=8,
+    use_threads=True,
+)
+
+# Read size when hashing local files for the ETag comparison.
+HASH_READ_SIZE = 1024 * 1024
+
+# MIME types for everything an HLS output directory can contain. The set is small and fixed,
+# so a static table replaces mimetypes.guess_type (and its registry) on the upload path.
 HLS_MIME_TYPES = {
     ".m3u8": "application/vnd.apple.mpegurl",
     ".ts": "video/MP2T",
+    ".m4s": "video/iso.segment",
+    ".mp4": "video/mp4",
+    ".m4a": "audio/mp4",
+    ".aac": "audio/aac",
+    ".vtt": "text/vtt",
+    ".key": "application/octet-stream",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".webp": "image/webp",
 }
+DEFAULT_CONTENT_TYPE = "application/octet-stream"
+
+def _content_type_for(path_str: str) -> str:
+    """Looks the extension up in HLS_MIME_TYPES straight from the path string, without a Path."""
+    _, dot, ext = path_str.rpartition(".")
+    if not dot or "/" in ext:
+        return DEFAULT_CONTENT_TYPE
+    return HLS_MIME_TYPES.get(f".{ext.lower()}", DEFAULT_CONTENT_TYPE)
+
+@dataclass(frozen=True, slots=True)
+class R2Config:
+    """R2 connection settings, read from the CF_* environment variables by get_r2_config()."""
+    # Kept out of repr, so logging the config (or a traceback showing it) doesn't leak credentials
+    access_key: str = field(repr=False)
+    secret_key: str = field(repr=False)
+    endpoint_url: str
+    bucket: str
+    public_cdn: str
+
+    def __post_init__(self):
+        missing_vars = [_R2_ENV_VARS[f.name] for f in fields(self) if not getattr(self, f.name)]
+        if missing_vars:
+            logger.error(f"Missing R2 configuration. Required env vars: {', '.join(missing_vars)}")
+            raise RuntimeError(f"Missing R2 configuration. Required env vars: {', '.join(missing_vars)}")
+
+_R2_ENV_VARS = {
+    "access_key": "CF_R2_KEY",
+    "secret_key": "CF_R2_SECRET",
+    "endpoint_url": "CF_R2_ENDPOINT",
+    "bucket": "CF_R2_BUCKET",
+    "public_cdn": "CF_PUBLIC_CDN",
+}
+
+@functools.lru_cache(maxsize=1)
+def get_r2_config() -> R2Config:
+    """
+    Reads and validates the R2 settings once per process; raises RuntimeError naming any
+    missing variables. Call it at worker startup to fail fast on misconfiguration.
+    A failed read isn't cached, so fixing the environment and retrying works.
+    """
+    return R2Config(**{name: os.getenv(env_var) for name, env_var in _R2_ENV_VARS.items()})
 
-async def _upload_boto3_task(s3_client, local_file_path_str: str, bucket_name: str, s3_key: str, content_type: str):
+@functools.lru_cache(maxsize=1)
+def _get_session() -> boto3.session.Session:
+    """
+    The process-wide boto3 Session. Building one loads botocore's service models, endpoint
+    data and credential chain, which is most of what boto3.client() costs; created lazily
+    rather than at import so importing the worker stays cheap.
+    """
+    return boto3.session.Session()
+
+@functools.lru_cache(maxsize=1)
+def _get_r2_client(config: R2Config):
+    """
+    Returns the S3 client for R2, created once per configuration and then reused, so its
+    connection pool (and the TLS sessions in it) stays warm across files and across publishes.
+    boto3 clients are thread-safe, so one client serves all upload threads. Sessions aren't, so
+    this is only called from the event loop thread; only the client crosses into the pool.
+    """
+    return _get_session().client(
+        's3',
+        aws_access_key_id=config.access_key,
+        aws_secret_access_key=config.secret_key,
+        endpoint_url=config.endpoint_url,
+        config=Config(
+            # One pooled connection per concurrent upload; the default pool of 10 would make the
+            # extra uploads wait for a connection (and log "Connection pool is full").
+            max_pool_connections=max(R2_UPLOAD_CONCURRENCY, R2_UPLOAD_THREADS),
+            tcp_keepalive=True,
+            # Request-level retries with client-side rate limiting when R2 throttles. Kept short
+            # since upload_file_with_retry retries whole files on top of this.
+            retries={"mode": "adaptive", "max_attempts": 3},
+        ),
+    )
+
+def _upload_boto3_task(s3_client, local_file_path_str: str, bucket_name: str, s3_key: str, content_type: str):
     """Synchronous part of the upload, to be run in a thread."""
+    file_size = os.path.getsize(local_file_path_str)
+    if file_size < TRANSFER_CONFIG.multipart_threshold:
+        # Below the multipart threshold upload_file would do a single PUT anyway, but via
+        # s3transfer's transfer manager and futures; calling put_object directly skips that.
+        with open(local_file_path_str, "rb") as body:
+            s3_client.put_object(
+                Bucket=bucket_name,
+                Key=s3_key,
+                Body=body,
+                ContentType=content_type,
+                ContentLength=file_size,
+            )
+        return
+
     s3_client.upload_file(
         local_file_path_str,
         bucket_name,
         s3_key,
-        ExtraArgs={'ContentType': content_type}
+        ExtraArgs={'ContentType': content_type},
+        Config=TRANSFER_CONFIG,
     )
 
+def _local_etag(local_file_path_str: str, part_count: int) -> str:
+    """
+    The ETag S3 would give this file: its MD5 for a single PUT, or for a multipart upload the MD5
+    of the parts' MD5s plus "-<parts>", with parts cut at TRANSFER_CONFIG.multipart_chunksize.
+    Files are read HASH_READ_SIZE at a time, so memory stays flat however large the file
+    (or part) is.
+    """
+    with open(local_file_path_str, "rb") as f:
+        if not part_count:
+            return hashlib.file_digest(f, "md5").hexdigest()
+        part_digests = []
+        while True:
+            part_md5 = hashlib.md5()
+            remaining = TRANSFER_CONFIG.multipart_chunksize
+            while remaining and (data := f.read(min(HASH_READ_SIZE, remaining))):
+                part_md5.update(data)
+                remaining -= len(data)
+            if remaining == TRANSFER_CONFIG.multipart_chunksize:
+                break # EOF at a part boundary
+            part_digests.append(part_md5.digest())
+            if remaining:
+                break # Short last part
+    return f"{hashlib.md5(b''.join(part_digests)).hexdigest()}-{len(part_digests)}"
+
+def _remote_matches(s3_client, local_file_path_str: str, bucket_name: str, s3_key: str) -> bool:
+    """True if the object at s3_key already has this file's content, judged by its ETag."""
+    try:
+        remote_etag = s3_client.head_object(Bucket=bucket_name, Key=s3_key)["ETag"].strip('"')
+    except ClientError:
+        return False # Not there yet (404), or not readable; just upload
+    # Multipart ETags are "<md5 of part md5s>-<parts>"; they can only match if the object was
+    # uploaded with the same part size as ours, which the part count is a cheap check for.
+    _, dash, parts = remote_etag.partition("-")
+    part_count = int(parts) if dash and parts.isdigit() else 0
+    if dash and not part_count:
+        return False
+    if part_count and part_count != -(-os.path.getsize(local_file_path_str) // TRANSFER_CONFIG.multipart_chunksize):
+        return False
+    return remote_etag == _local_etag(local_file_path_str, part_count)
+
+def _upload_if_changed_task(s3_client, local_file_path_str: str, bucket_name: str, s3_key: str, content_type: str):
+    """Like _upload_boto3_task, but skips the upload when the stored object is identical."""
+    if _remote_matches(s3_client, local_file_path_str, bucket_name, s3_key):
+        logger.debug("Skipping unchanged %s, s3://%s/%s is identical", local_file_path_str, bucket_name, s3_key)
+        return
+    _upload_boto3_task(s3_client, local_file_path_str, bucket_name, s3_key, content_type)
+
+async def _run_in_upload_executor(func, *args):
+    """
+    Runs a blocking boto3 call on the upload pool. The hop costs microseconds against a PUT's
+    network round trip, and keeps the uploader on plain boto3 rather than an async S3 client.
+    """
+    return await asyncio.get_running_loop().run_in_executor(_upload_executor, func, *args)
+
+def _iter_files(dir_path: str, rel_dir: str = ""):
+    """
+    Yields (path, relative_path) for every file under dir_path, relative paths '/'-separated.
+    DirEntry carries the file type from readdir, so no stat() is needed per entry.
+    """
+    with os.scandir(dir_path) as entries:
+        for entry in entries:
+            rel_path = f"{rel_dir}{entry.name}"
+            if entry.is_dir(follow_symlinks=False):
+                yield from _iter_files(entry.path, f"{rel_path}/")
+            elif entry.is_file():
+                yield entry.path, rel_path
+
+class UploadTimeoutError(RuntimeError):
+    """A file's retries would run past MAX_TOTAL_RETRY_SECONDS. A RuntimeError like other upload failures."""
+    def __init__(self, s3_key: str, attempts: int, budget_seconds: float):
+        super().__init__(f"Failed to upload {s3_key} to S3: gave up after {attempts} attempts, retrying would exceed the {budget_seconds:g}s budget")
+        self.s3_key = s3_key
+        self.attempts = attempts
+        self.budget_seconds = budget_seconds
+
+# What an upload attempt can raise on the S3 side. Anything else (a local OSError, a bug,
+# CancelledError) propagates as-is, without being retried.
+UPLOAD_ERRORS = (ClientError, S3UploadFailedError, BotoCoreError)
+
+def _list_files(dir_path: str) -> list:
+    """
+    All of _iter_files, sorted by relative path. Listing order depends on the filesystem, so
+    sorting makes the upload order (and the logs) the same on every run.
+    """
+    return sorted(_iter_files(dir_path), key=lambda walked: walked[1])
+
+def _is_retryable(error: Exception) -> bool:
+    # upload_file reports S3 errors as S3UploadFailedError raised while handling the underlying error
+    if isinstance(error, S3UploadFailedError) and error.__context__ is not None:
+        error = error.__context__
+    if isinstance(error, (BotoConnectionError, HTTPClientError)):
+        return True # Connection refused/reset, connect and read timeouts, ...
+    if not isinstance(error, ClientError):
+        return isinstance(error, S3UploadFailedError)
+    status_code = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode") or 0
+    if status_code >= 500 or status_code == 429:
+        return True
+    return error.response.get("Error", {}).get("Code") in RETRYABLE_ERROR_CODES
+
 async def upload_file_with_retry(
     s3_client,
-    local_file_path: Path,
+    local_file_path: Union[str, Path],
     bucket_name: str,
     s3_key: str,
-    content_type: str
+    content_type: str,
+    skip_unchanged: bool = False,
+    *,
+    sleep_fn: Callable[[float], Awaitable[None]] = asyncio.sleep,
 ):
-    """Uploads a single file to S3 with retry logic, running sync boto3 calls in a thread."""
-    current_retry = 0
-    delay = INITIAL_BACKOFF_SECONDS
-    last_exception = None
-    while current_retry < MAX_RETRIES:
+    """
+    Uploads a single file to S3 with retry logic, running sync boto3 calls on the upload thread pool.
+    With skip_unchanged, a file whose content is already stored under s3_key isn't uploaded again.
+    Backoff delays are awaited through sleep_fn.
+    """
+    local_file_path_str = os.fspath(local_file_path)
+    upload_task = _upload_if_changed_task if skip_unchanged else _upload_boto3_task
+    started_at = time.monotonic()
+    for attempt in range(1, MAX_RETRIES + 1):
         try:
-            logger.info(f"Uploading {local_file_path} to s3://{bucket_name}/{s3_key} (Attempt {current_retry + 1}/{MAX_RETRIES})")
-            await asyncio.to_thread(
-                _upload_boto3_task,
+            logger.debug("Uploading %s to s3://%s/%s (Attempt %d/%d)", local_file_path_str, bucket_name, s3_key, attempt, MAX_RETRIES)
+            await _run_in_upload_executor(
+                upload_task,
                 s3_client,
-                str(local_file_path),
+                local_file_path_str,
                 bucket_name,
                 s3_key,
                 content_type
             )
-            logger.info(f"Successfully uploaded {local_file_path} to s3://{bucket_name}/{s3_key}")
+            logger.debug("Successfully uploaded %s to s3://%s/%s", local_file_path_str, bucket_name, s3_key)
             return
-        except ClientError as e:
-            logger.warning(f"ClientError during S3 upload of {s3_key} (Attempt {current_retry + 1}): {e}. Retrying...")
-            last_exception = e
-        except Exception as e:
-            logger.warning(f"Unexpected error during S3 upload of {s3_key} (Attempt {current_retry + 1}): {e}. Retrying...")
-            last_exception = e
-
-        current_retry += 1
-        if current_retry < MAX_RETRIES:
-            logger.info(f"Waiting {delay} seconds before next retry for {s3_key}.")
-            await asyncio.sleep(delay)
-            delay *= 2
-    
-    logger.error(f"Failed to upload {s3_key} after {MAX_RETRIES} attempts.")
-    raise RuntimeError(f"Failed to upload {s3_key} to S3 after {MAX_RETRIES} attempts. Last error: {last_exception}")
+        except UPLOAD_ERRORS as e:
+            if not _is_retryable(e):
+                logger.error("Non-retryable error during S3 upload of %s (Attempt %d): %s", s3_key, attempt, e)
+                raise RuntimeError(f"Failed to upload {s3_key} to S3: {e}") from e
+            if attempt == MAX_RETRIES:
+                logger.error("Failed to upload %s after %d attempts.", s3_key, MAX_RETRIES)
+                raise RuntimeError(f"Failed to upload {s3_key} to S3 after {MAX_RETRIES} attempts. Last error: {e}") from e
+            delay = random.uniform(0, min(MAX_BACKOFF_SECONDS, INITIAL_BACKOFF_SECONDS * 2 ** attempt))
+            if time.monotonic() - started_at + delay > MAX_TOTAL_RETRY_SECONDS:
+                logger.error("Giving up on %s after %d attempts: retrying would exceed the %gs budget.", s3_key, attempt, MAX_TOTAL_RETRY_SECONDS)
+                raise UploadTimeoutError(s3_key, attempt, MAX_TOTAL_RETRY_SECONDS) from e
+            logger.warning("Error during S3 upload of %s (Attempt %d): %s. Retrying...", s3_key, attempt, e)
+
+        logger.debug("Waiting %.2f seconds before next retry for %s.", delay, s3_key)
+        await sleep_fn(delay)
 
-async def upload_dir_to_r2(local_dir: Path, remote_prefix: str) -> str:
+async def upload_dir_to_r2(
+    local_dir: Path,
+    remote_prefix: str,
+    skip_unchanged: bool = R2_SKIP_UNCHANGED,
+    *,
+    sleep_fn: Callable[[float], Awaitable[None]] = asyncio.sleep,
+) -> str:
     """
     Uploads all files from a local directory to Cloudflare R2 (S3-compatible).
 
     Args:
         local_dir: Path to the local directory containing files to upload.
         remote_prefix: The prefix for the S3 keys (e.g., "answers/<answer_id>").
+        skip_unchanged: Skip files already stored with identical content (defaults to R2_SKIP_UNCHANGED).
+        sleep_fn: Awaited with each retry backoff delay (asyncio.sleep; tests pass a mock).
 
     Returns:
         The public HTTPS URL for the 'master.m3u8' file.
 
     Raises:
         RuntimeError: If configuration is missing or upload fails persistently.
+        UploadTimeoutError: If a file's retries run out of time (a RuntimeError subclass).
         FileNotFoundError: If local_dir does not exist.
     """
     if not local_dir.is_dir():
         raise FileNotFoundError(f"Local directory not found: {local_dir}")
 
-    cf_r2_key = os.getenv("CF_R2_KEY")
-    cf_r2_secret = os.getenv("CF_R2_SECRET")
-    cf_r2_endpoint = os.getenv("CF_R2_ENDPOINT")
-    cf_r2_bucket = os.getenv("CF_R2_BUCKET")
-    cf_public_cdn = os.getenv("CF_PUBLIC_CDN")
-
-    required_env_vars = {
-        "CF_R2_KEY": cf_r2_key, "CF_R2_SECRET": cf_r2_secret,
-        "CF_R2_ENDPOINT": cf_r2_endpoint, "CF_R2_BUCKET": cf_r2_bucket,
-        "CF_PUBLIC_CDN": cf_public_cdn
-    }
-    missing_vars = [var_name for var_name, val in required_env_vars.items() if not val]
-    if missing_vars:
-        logger.error(f"Missing R2 configuration. Required env vars: {', '.join(missing_vars)}")
-        raise RuntimeError(f"Missing R2 configuration. Required env vars: {', '.join(missing_vars)}")
+    r2_config = get_r2_config()
 
     try:
-        s3_client = boto3.client(
-            's3',
-            aws_access_key_id=cf_r2_key,
-            aws_secret_access_key=cf_r2_secret,
-            endpoint_url=cf_r2_endpoint,
-        )
+        s3_client = _get_r2_client(r2_config)
     except NoCredentialsError:
         logger.error("Boto3 NoCredentialsError: AWS credentials not found or incomplete for R2.")
         raise RuntimeError("AWS credentials not found or incomplete for R2 upload.")
@@ -116,31 +363,55 @@ async def upload_dir_to_r2(local_dir: Path, remote_prefix: str) -> str:
         logger.error(f"Error creating S3 client for R2: {e}")
         raise RuntimeError(f"Error creating S3 client for R2: {e}")
 
-    # Upload files sequentially. For parallel uploads, create a list of tasks and use asyncio.gather.
-    for local_file_path in local_dir.rglob('*'):
-        if local_file_path.is_file():
-            relative_path_to_file = local_file_path.relative_to(local_dir)
-            s3_key = f"{remote_prefix.strip('/')}/{str(relative_path_to_file).replace('\\', '/')}"
-
-            file_ext = local_file_path.suffix.lower()
-            content_type = HLS_MIME_TYPES.get(file_ext)
-            if not content_type:
-                content_type, _ = mimetypes.guess_type(str(local_file_path))
-                if not content_type:
-                    content_type = 'application/octet-stream'
-            
-            await upload_file_with_retry(s3_client, local_file_path, cf_r2_bucket, s3_key, content_type)
-
-    # Ensure master.m3u8 exists locally to form the URL (packager should guarantee this)
-    expected_master_manifest_local_path = local_dir / "master.m3u8"
-    if not expected_master_manifest_local_path.exists():
+    # Upload files concurrently. An HLS output is mostly small .ts segments, so the total time is
+    # dominated by per-request round trips rather than bandwidth; overlapping them brings the
+    # directory upload close to a single round trip. upload_file switches to multipart on its own
+    # for large files.
+    key_prefix = f"{remote_prefix.strip('/')}/"
+    master_manifest_s3_key = f"{key_prefix}master.m3u8"
+    uploads = []
+    # The walk yields plain path strings; they're passed down as-is rather than rebuilt into a Path
+    # (and stringified again) per file. It runs in a thread, since on a slow disk or network mount
+    # listing a few hundred segments would otherwise stall the event loop.
+    walked_files = await asyncio.to_thread(_list_files, os.fspath(local_dir))
+    for local_file_path_str, relative_path_to_file in walked_files:
+        s3_key = key_prefix + relative_path_to_file
+        content_type = _content_type_for(relative_path_to_file)
+        uploads.append((local_file_path_str, s3_key, content_type))
+
+    # The public URL points at master.m3u8, so it must be among the files (packager should
+    # guarantee this). The walk already listed them, so no extra stat; checking before uploading
+    # also avoids leaving a manifest-less upload behind in the bucket.
+    master_uploads = [upload for upload in uploads if upload[1] == master_manifest_s3_key]
+    if not master_uploads:
         logger.error(f"master.m3u8 not found in local HLS output directory: {local_dir}")
         raise RuntimeError(f"master.m3u8 not found in {local_dir}, cannot form public URL.")
+    segment_uploads = [upload for upload in uploads if upload[1] != master_manifest_s3_key]
+
+    semaphore = asyncio.Semaphore(R2_UPLOAD_CONCURRENCY)
+
+    async def _bounded_upload(local_file_path_str: str, s3_key: str, content_type: str):
+        async with semaphore:
+            await upload_file_with_retry(s3_client, local_file_path_str, r2_config.bucket, s3_key, content_type, skip_unchanged, sleep_fn=sleep_fn)
+
+    async def _upload_all(batch):
+        tasks = [asyncio.create_task(_bounded_upload(*upload)) for upload in batch]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # One file failed for good, so the answer can't be published; don't keep uploading the rest.
+            for task in tasks:
+                task.cancel()
+            raise
+
+    # master.m3u8 goes up only once everything it references is there, so a manifest in the bucket
+    # never points at missing playlists or segments, even after a failed or half-done upload.
+    await _upload_all(segment_uploads)
+    await _upload_all(master_uploads)
 
-    master_manifest_s3_key = f"{remote_prefix.strip('/')}/master.m3u8"
-    public_url = f"{cf_public_cdn.strip('/')}/{master_manifest_s3_key}"
+    public_url = f"{r2_config.public_cdn.strip('/')}/{master_manifest_s3_key}"
     
-    logger.info(f"All files from {local_dir} uploaded to R2 prefix {remote_prefix}.")
+    logger.info(f"All {len(uploads)} files from {local_dir} uploaded to R2 prefix {remote_prefix}.")
     logger.info(f"Public HLS manifest URL: {public_url}")
     
     return public_url
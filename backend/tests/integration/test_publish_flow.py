@@ -48,35 +48,43 @@ def mock_r2_env_vars(monkeypatch):
     monkeypatch.setenv("CF_R2_BUCKET", "int-test-bucket")
     monkeypatch.setenv("CF_PUBLIC_CDN", "https://int-test-cdn.com")
 
-@pytest.fixture
-def dummy_answer_setup(tmp_path: Path) -> dict:
-    answer_id = uuid.uuid4()
-    slug = f"test-answer-{answer_id}"
-    mp4_dir = tmp_path / "media" / "answers"
-    mp4_dir.mkdir(parents=True, exist_ok=True)
-    mp4_path = mp4_dir / f"{answer_id}.mp4"
-    
-    # Create a small dummy MP4 file
-    ffmpeg_path = shutil.which("ffmpeg")
-    if not ffmpeg_path:
+# Looked up once at import; only the tests that need an MP4 on disk are skipped without it.
+FFMPEG_PATH = shutil.which("ffmpeg")
+
+@pytest.fixture(scope="session")
+def cached_dummy_mp4(tmp_path_factory) -> Path:
+    """A tiny MP4, encoded once per test session. Its content doesn't matter: packaging is mocked."""
+    if not FFMPEG_PATH:
         pytest.skip("ffmpeg not found, cannot create dummy MP4 for integration test.")
-    
+
+    mp4_path = tmp_path_factory.mktemp("dummy_mp4_cache") / "blue.mp4"
+    # mpeg4 at a fixed quantizer encodes a second of video in milliseconds, unlike libx264's defaults
     args = [
-        ffmpeg_path, "-y",
+        FFMPEG_PATH, "-y", "-hide_banner", "-loglevel", "error",
         "-f", "lavfi", "-i", "color=c=blue:s=128x72:d=1:r=1",
         "-f", "lavfi", "-i", "anullsrc=channel_layout=mono:sample_rate=22050",
-        "-c:v", "libx264", "-profile:v", "baseline", "-level", "1.0", "-pix_fmt", "yuv420p",
+        "-c:v", "mpeg4", "-qscale:v", "15",
         "-c:a", "aac", "-shortest",
         str(mp4_path)
     ]
-    # Run ffmpeg synchronously for fixture setup
+    # Run ffmpeg synchronously for fixture setup; with -loglevel error, stderr only carries the failure reason
     import subprocess
-    process = subprocess.run(args, capture_output=True, text=True)
+    process = subprocess.run(args, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
     if process.returncode != 0:
-        pytest.fail(f"Failed to create dummy MP4 for integration test. ffmpeg stderr: {process.stderr}")
+        pytest.fail(f"Failed to create dummy MP4 for integration test. ffmpeg stderr: {process.stderr.decode(errors='ignore')}")
     
     if not mp4_path.exists() or mp4_path.stat().st_size == 0:
         pytest.fail("Dummy MP4 for integration test was not created or is empty.")
+    return mp4_path
+
+@pytest.fixture
+def dummy_answer_setup(tmp_path: Path, cached_dummy_mp4: Path) -> dict:
+    answer_id = uuid.uuid4()
+    slug = f"test-answer-{answer_id}"
+    mp4_dir = tmp_path / "media" / "answers"
+    mp4_dir.mkdir(parents=True, exist_ok=True)
+    mp4_path = mp4_dir / f"{answer_id}.mp4"
+    shutil.copyfile(cached_dummy_mp4, mp4_path)
 
     # Initial answer data for the placeholder DB in answers_api.py
     initial_answer_data = {
@@ -119,7 +127,8 @@ async def test_publish_flow_e2e(
     # The packager should create files in a temp dir and return the master manifest path
     # We need to simulate this behavior.
     async def fake_package_to_hls(mp4_p: Path, out_d: Path) -> Path:
-        # Simulate HLS files being created
+        # Simulate HLS files being created (mkdtemp is patched below, so the dir may not exist yet)
+        out_d.mkdir(parents=True, exist_ok=True)
         master_m3u8 = out_d / "master.m3u8"
         master_m3u8.write_text("#EXTM3U...")
         (out_d / "v0_00000.ts").write_text("segment data")
@@ -146,22 +155,31 @@ async def test_publish_flow_e2e(
             return True
         return False
 
-    with patch("app.services.publish_answer.package_to_hls", mock_hls_packager),
-         patch("app.services.publish_answer.upload_dir_to_r2", mock_r2_uploader),
-         patch("app.services.publish_answer.get_answer_by_id", side_effect=fake_get_answer_by_id) as mock_service_get_answer,
-         patch("app.services.publish_answer.update_answer_status_and_url", side_effect=fake_update_answer) as mock_service_update_answer,
-         patch("tempfile.mkdtemp", return_value=str(tmp_path / "test_hls_temp_output")) as mock_mkdtemp: # Control temp dir
+    async def fake_mark_answer_live(ans_id, hls_url):
+        answer = answers_api._db_answers.get(ans_id)
+        if not answer or answer["status"] != "READY":
+            return False
+        answer.update(status="LIVE", hls_manifest_url=hls_url, video_url=hls_url, updated_at="now")
+        return True
+
+    with (
+        patch("app.services.publish_answer.package_to_hls", mock_hls_packager),
+        patch("app.services.publish_answer.upload_dir_to_r2", mock_r2_uploader),
+        patch("app.services.publish_answer.get_answer_by_id", side_effect=fake_get_answer_by_id) as mock_service_get_answer,
+        patch("app.services.publish_answer.update_answer_status_and_url", side_effect=fake_update_answer) as mock_service_update_answer,
+        patch("app.services.publish_answer.mark_answer_live", side_effect=fake_mark_answer_live) as mock_service_mark_live,
+        patch("tempfile.mkdtemp", return_value=str(tmp_path / "test_hls_temp_output")) as mock_mkdtemp, # Control temp dir
+    ):
         
         # --- Act: Call the publish API endpoint --- #
-        # The API currently calls publish_answer directly, not as a background task.
-        # So, we expect a 200 if successful, or an error code.
+        # The API queues publish_answer as a background task and answers 202 right away.
+        # TestClient runs background tasks before returning, so the publish has finished below.
         response = client.post(f"/api/publish-video/{answer_id}")
 
         # --- Assert: Initial publish call --- #
-        assert response.status_code == 200, f"Publish API call failed: {response.text}"
+        assert response.status_code == 202, f"Publish API call failed: {response.text}"
         response_json = response.json()
-        assert response_json["status"] == "LIVE"
-        assert response_json["url"] == expected_public_url
+        assert response_json["status"] == "QUEUED"
 
         # Verify mocks were called
         mock_service_get_answer.assert_called_with(answer_id)
@@ -175,12 +193,12 @@ async def test_publish_flow_e2e(
         assert mock_r2_uploader.call_args[0][0] == mock_hls_packager.call_args[0][1]
         assert mock_r2_uploader.call_args[0][1] == f"answers/{answer_id}"
 
-        mock_service_update_answer.assert_called_with(answer_id, "LIVE", hls_url=expected_public_url, video_url=expected_public_url)
+        mock_service_mark_live.assert_called_once_with(answer_id, expected_public_url)
+        mock_service_update_answer.assert_not_called() # Only used on error paths
         mock_mkdtemp.assert_called_once() # Ensure temp dir was created
 
         # --- Assert: Polling for answer status (simulated by direct GET) --- #
-        # The publish call is synchronous in the current API, so status should be LIVE immediately.
-        # If it were truly async with polling, the loop would be here.
+        # The background publish has already run (see above), so status should be LIVE on the first poll.
         
         poll_response = client.get(f"/api/answer/{slug}")
         assert poll_response.status_code == 200, f"Polling answer failed: {poll_response.text}"
@@ -199,3 +217,167 @@ async def test_publish_flow_e2e(
         if answer_id in answers_api._db_citations:
             del answers_api._db_citations[answer_id]
 
+@pytest.mark.asyncio
+async def test_publish_rejects_answer_not_ready(client: TestClient, dummy_answer_setup: dict):
+    """A non-READY answer is rejected synchronously with 409, before anything is queued."""
+    answer_id = dummy_answer_setup["id"]
+    not_ready_answer = {**dummy_answer_setup, "status": "PENDING"}
+
+    async def fake_get_answer_by_id(ans_id):
+        return not_ready_answer if ans_id == answer_id else None
+
+    with (
+        patch("app.services.publish_answer.get_answer_by_id", side_effect=fake_get_answer_by_id),
+        patch("app.services.publish_answer.package_to_hls", AsyncMock()) as mock_hls_packager,
+    ):
+        response = client.post(f"/api/publish-video/{answer_id}")
+
+    assert response.status_code == 409
+    assert "not in READY state" in response.json()["detail"]
+    mock_hls_packager.assert_not_called()
+
+def test_get_live_answer_served_from_cache(client: TestClient):
+    """A LIVE answer's response is cached, so later DB changes don't show until it's invalidated."""
+    from app.api.routes import answers_api
+    from app.services.answer_cache import invalidate_answer
+
+    answer_id = uuid.uuid4()
+    slug = f"cached-answer-{answer_id}"
+    answers_api._db_answers[answer_id] = {
+        "id": answer_id,
+        "slug": slug,
+        "title": "Cached Answer",
+        "status": "LIVE",
+        "hls_manifest_url": "https://int-test-cdn.com/master.m3u8",
+        "video_url": "https://int-test-cdn.com/master.m3u8",
+    }
+
+    first = client.get(f"/api/answer/{slug}")
+    answers_api._db_answers[answer_id]["title"] = "Renamed Answer"
+    second = client.get(f"/api/answer/{slug}")
+
+    assert first.status_code == second.status_code == 200
+    assert second.headers["content-type"] == "application/json"
+    assert second.json() == first.json()
+    assert second.json()["title"] == "Cached Answer"
+
+    invalidate_answer(answer_id)
+    assert client.get(f"/api/answer/{slug}").json()["title"] == "Renamed Answer"
+
+    invalidate_answer(answer_id)
+    del answers_api._db_answers[answer_id]
+
+def test_answer_schema_keeps_identity_fields_required(test_app):
+    """id, slug, status and citations must stay required in the published OpenAPI schema."""
+    schemas = test_app.openapi()["components"]["schemas"]
+
+    assert {"id", "slug", "status", "citations"} <= set(schemas["AnswerResponse"]["required"])
+    assert {"video_id", "start_sec", "text"} <= set(schemas["CitationItem"]["required"])
+
+def test_get_answer_fills_placeholder_gaps(client: TestClient):
+    """An incomplete placeholder row still comes back with its own id and the usual fallbacks."""
+    from app.api.routes import answers_api
+
+    answer_id = uuid.uuid4()
+    slug = f"sparse-answer-{answer_id}"
+    answers_api._db_answers[answer_id] = {"slug": slug}
+    answers_api._db_citations[answer_id] = [{"start_sec": 12}]
+
+    body = client.get(f"/api/answer/{slug}").json()
+
+    assert body["id"] == str(answer_id)
+    assert body["title"] == "Untitled Answer"
+    assert body["status"] == "PENDING"
+    assert body["citations"] == [{"video_id": "unknown_video_id", "start_sec": 12, "text": ""}]
+
+    del answers_api._db_answers[answer_id]
+    del answers_api._db_citations[answer_id]
+
+@pytest.mark.asyncio
+async def test_status_change_invalidates_cached_live_answer():
+    """Moving a cached LIVE answer to another status drops its cached response."""
+    from app.services.answer_cache import cache_answer, get_cached_answer
+    from app.services.publish_answer import update_answer_status_and_url, AnswerStatus
+
+    answer_id = uuid.uuid4()
+    slug = f"unpublished-answer-{answer_id}"
+    cache_answer(slug, answer_id, b'{"status": "LIVE"}')
+
+    await update_answer_status_and_url(answer_id, AnswerStatus.ERROR)
+
+    assert get_cached_answer(slug) is None
+
+def test_invalidate_hot_answer_after_other_entries_evicted(monkeypatch):
+    """A slug kept hot by reads can still be invalidated after the cache has cycled other entries."""
+    from app.services import answer_cache
+
+    monkeypatch.setattr(answer_cache._responses_by_slug, "maxsize", 3)
+    hot_id = uuid.uuid4()
+    answer_cache.cache_answer("hot-answer", hot_id, b'{"status": "LIVE"}')
+    for i in range(10):
+        answer_cache.cache_answer(f"cold-answer-{i}", uuid.uuid4(), b"{}")
+        assert answer_cache.get_cached_answer("hot-answer") is not None # Read keeps it most recent
+
+    answer_cache.invalidate_answer(hot_id)
+
+    assert answer_cache.get_cached_answer("hot-answer") is None
+    answer_cache.clear_answer_cache()
+
+@pytest.mark.asyncio
+async def test_late_publish_failure_does_not_demote_live_answer(tmp_path: Path):
+    """A publish that fails after a concurrent one made the answer LIVE leaves it LIVE."""
+    from app.services.publish_answer import publish_answer, AnswerStatus
+
+    answer_id = uuid.uuid4()
+    mp4_path = tmp_path / "answer.mp4"
+    mp4_path.write_bytes(b"not really an mp4")
+    answer = {"id": answer_id, "status": "READY", "mp4_path": str(mp4_path)}
+
+    async def fake_get_answer_by_id(ans_id):
+        return answer
+
+    async def fake_package_to_hls(mp4_p: Path, out_d: Path) -> Path:
+        answer["status"] = "LIVE" # The other publish finishes while this one is still packaging
+        raise RuntimeError("ffmpeg failed")
+
+    async def fake_mark_answer_failed(ans_id):
+        if answer["status"] != "READY":
+            return False
+        answer["status"] = "ERROR"
+        return True
+
+    with (
+        patch("app.services.publish_answer.get_answer_by_id", side_effect=fake_get_answer_by_id),
+        patch("app.services.publish_answer.package_to_hls", side_effect=fake_package_to_hls),
+        patch("app.services.publish_answer.mark_answer_failed", side_effect=fake_mark_answer_failed) as mock_mark_failed,
+        patch("app.services.publish_answer.update_answer_status_and_url") as mock_update_answer,
+    ):
+        result = await publish_answer(answer_id)
+
+    assert result["status"] == AnswerStatus.ERROR
+    mock_mark_failed.assert_called_once_with(answer_id)
+    mock_update_answer.assert_not_called()
+    assert answer["status"] == "LIVE"
+
+@pytest.mark.parametrize(
+    "shm_free, expected",
+    [
+        (1024 * 1024 * 1024, "/dev/shm"), # Plenty of room (--shm-size=1g)
+        (64 * 1024 * 1024, None),         # Docker's 64MB default: regular temp dir
+    ],
+)
+def test_hls_tmp_dir_falls_back_when_shm_is_small(monkeypatch, shm_free: int, expected):
+    from app.services import publish_answer as publish_service
+
+    monkeypatch.setattr(publish_service, "HLS_TMP_DIR", None)
+    monkeypatch.setattr(publish_service.shutil, "disk_usage", lambda path: MagicMock(free=shm_free))
+
+    assert publish_service._hls_tmp_dir() == expected
+
+def test_hls_tmp_dir_override_skips_free_space_check(monkeypatch, tmp_path: Path):
+    from app.services import publish_answer as publish_service
+
+    monkeypatch.setattr(publish_service, "HLS_TMP_DIR", str(tmp_path))
+    monkeypatch.setattr(publish_service.shutil, "disk_usage", MagicMock(side_effect=AssertionError))
+
+    assert publish_service._hls_tmp_dir() == str(tmp_path)
@@ -1,56 +1,28 @@
 import asyncio
 import os
 from pathlib import Path
-import shutil
 import tempfile
 import pytest
-from unittest.mock import AsyncMock, patch, MagicMock
+from unittest.mock import AsyncMock, patch
 
 # Adjust the import path based on your project structure
-from app.workers.hls_packager import package_to_hls
+from app.workers import hls_packager
+from app.workers.hls_packager import package_to_hls, _can_stream_copy, _probe
+
+# Placeholder input, not a valid MP4: an 'ftyp' box and an empty 'mdat', with no 'moov'. Every
+# test using it mocks _probe and create_subprocess_exec, so the file only has to exist; nothing
+# ever parses it.
+DUMMY_MP4_BYTES = (
+    b"\x00\x00\x00\x18ftypisom\x00\x00\x02\x00isommp41"
+    b"\x00\x00\x00\x08mdat"
+)
 
 @pytest.fixture
-async def dummy_mp4_file() -> Path:
-    """Creates a small, short dummy MP4 file for testing."""
-    temp_dir = tempfile.mkdtemp(prefix="test_packager_dummy_mp4_")
-    dummy_file_path = Path(temp_dir) / "dummy_video.mp4"
-    
-    ffmpeg_path = shutil.which("ffmpeg")
-    if not ffmpeg_path:
-        pytest.skip("ffmpeg not found, cannot create dummy MP4 for packager test.")
-
-    # Create a 1-second black video with silent audio
-    # Using a simpler command that is less likely to fail due to complex lavfi filters
-    # if the full ffmpeg suite isn't perfectly set up.
-    # This creates a very small H.264 video.
-    args = [
-        ffmpeg_path,
-        "-y",  # Overwrite output files without asking
-        "-f", "lavfi", "-i", "color=c=black:s=128x72:d=1:r=1", # 1 sec, 1fps, 128x72 black video
-        "-f", "lavfi", "-i", "anullsrc=channel_layout=stereo:sample_rate=44100", # 1 sec silent audio
-        "-c:v", "libx264", "-profile:v", "baseline", "-level", "3.0", "-pix_fmt", "yuv420p",
-        "-c:a", "aac", "-shortest",
-        str(dummy_file_path)
-    ]
-    
-    process = await asyncio.create_subprocess_exec(
-        *args,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE
-    )
-    stdout, stderr = await process.communicate()
-
-    if process.returncode != 0:
-        print(f"Failed to create dummy MP4. Stderr: {stderr.decode(errors=\'ignore\')}")
-        pytest.fail(f"Failed to create dummy MP4 for testing. ffmpeg stderr: {stderr.decode(errors=\'ignore\')}")
-    
-    if not dummy_file_path.exists() or dummy_file_path.stat().st_size == 0:
-        pytest.fail("Dummy MP4 file was not created or is empty.")
-
-    yield dummy_file_path
-    
-    # Teardown: remove the temporary directory and its contents
-    shutil.rmtree(temp_dir)
+def dummy_mp4_file(tmp_path: Path) -> Path:
+    """Writes a tiny dummy MP4 file for testing."""
+    dummy_file_path = tmp_path / "dummy_video.mp4"
+    dummy_file_path.write_bytes(DUMMY_MP4_BYTES)
+    return dummy_file_path
 
 @pytest.mark.asyncio
 async def test_package_to_hls_success(dummy_mp4_file: Path):
@@ -62,17 +34,24 @@ async def test_package_to_hls_success(dummy_mp4_file: Path):
         with patch("shutil.which", return_value="/fake/path/to/ffmpeg") as mock_which:
             # Mock the subprocess execution
             mock_process = AsyncMock()
-            mock_process.communicate = AsyncMock(return_value=(b"stdout", b"stderr"))
+            mock_process.communicate = AsyncMock(return_value=(None, b""))
             mock_process.returncode = 0
             
-            with patch("asyncio.create_subprocess_exec", return_value=mock_process) as mock_create_subprocess:
+            # No probe result: take the full re-encode path
+            with (
+                patch("asyncio.create_subprocess_exec", return_value=mock_process) as mock_create_subprocess,
+                patch("app.workers.hls_packager._probe", AsyncMock(return_value=None)),
+            ):
                 master_manifest_path = await package_to_hls(dummy_mp4_file, out_dir)
                 
                 mock_which.assert_called_once_with("ffmpeg")
                 mock_create_subprocess.assert_called_once()
-                args, _ = mock_create_subprocess.call_args
+                args, kwargs = mock_create_subprocess.call_args
                 assert str(dummy_mp4_file) in args
                 assert str(out_dir / "master.m3u8") in args
+                assert "libx264" in args
+                assert kwargs["stdin"] == asyncio.subprocess.DEVNULL
+                assert kwargs["close_fds"] is False
 
                 # Simulate ffmpeg creating the files for assertion purposes
                 # In a real test with actual ffmpeg, these would be created by the command.
@@ -119,10 +98,13 @@ async def test_package_to_hls_ffmpeg_fails(dummy_mp4_file: Path):
 
         with patch("shutil.which", return_value="/fake/path/to/ffmpeg"): # ffmpeg is "found"
             mock_process = AsyncMock()
-            mock_process.communicate = AsyncMock(return_value=(b"stdout error details", b"stderr error details"))
+            mock_process.communicate = AsyncMock(return_value=(None, b"stderr error details"))
             mock_process.returncode = 1 # Simulate ffmpeg failure
             
-            with patch("asyncio.create_subprocess_exec", return_value=mock_process) as mock_create_subprocess:
+            with (
+                patch("asyncio.create_subprocess_exec", return_value=mock_process) as mock_create_subprocess,
+                patch("app.workers.hls_packager._probe", AsyncMock(return_value=None)),
+            ):
                 with pytest.raises(RuntimeError) as excinfo:
                     await package_to_hls(dummy_mp4_file, out_dir)
                 
@@ -130,3 +112,125 @@ async def test_package_to_hls_ffmpeg_fails(dummy_mp4_file: Path):
                 assert "stderr error details" in str(excinfo.value)
                 mock_create_subprocess.assert_called_once()
 
+CONFORMING_VIDEO_STREAM = {
+    "codec_type": "video", "codec_name": "h264", "profile": "High", "pix_fmt": "yuv420p",
+    "height": 720, "bit_rate": "2500000",
+}
+
+@pytest.mark.asyncio
+async def test_package_to_hls_stream_copies_conforming_input(dummy_mp4_file: Path):
+    """Test that an input already matching the HLS profile is remuxed instead of re-encoded."""
+    probe_result = {
+        "streams": [
+            dict(CONFORMING_VIDEO_STREAM),
+            {"codec_type": "audio", "codec_name": "aac", "bit_rate": "128000"},
+        ]
+    }
+    with tempfile.TemporaryDirectory(prefix="test_hls_copy_") as tmp_out_dir_str:
+        out_dir = Path(tmp_out_dir_str)
+
+        with patch("shutil.which", return_value="/fake/path/to/ffmpeg"):
+            mock_process = AsyncMock()
+            mock_process.communicate = AsyncMock(return_value=(None, b""))
+            mock_process.returncode = 0
+
+            with (
+                patch("asyncio.create_subprocess_exec", return_value=mock_process) as mock_create_subprocess,
+                patch("app.workers.hls_packager._probe", AsyncMock(return_value=probe_result)),
+            ):
+                await package_to_hls(dummy_mp4_file, out_dir)
+
+            args, _ = mock_create_subprocess.call_args
+            assert "copy" in args
+            assert "h264_mp4toannexb" in args
+            assert "libx264" not in args
+
+@pytest.mark.parametrize(
+    "video_overrides, audio_codec",
+    [
+        ({"height": 1080}, "aac"),                  # Above the 720p target
+        ({}, "opus"),                               # Audio that isn't AAC
+        ({"bit_rate": None}, "aac"),                # ffprobe gave no video bit_rate
+        ({"pix_fmt": "yuv420p10le"}, "aac"),        # 10-bit
+        ({"pix_fmt": "yuv422p"}, "aac"),            # 4:2:2 chroma
+        ({"profile": "High 10"}, "aac"),
+        ({"profile": None}, "aac"),
+    ],
+)
+def test_can_stream_copy_rejects_nonconforming_input(video_overrides: dict, audio_codec: str):
+    """Inputs outside the HLS target profile must be re-encoded, not remuxed."""
+    video = {**CONFORMING_VIDEO_STREAM, **video_overrides}
+    video = {k: v for k, v in video.items() if v is not None}
+    probe_result = {"streams": [video, {"codec_type": "audio", "codec_name": audio_codec}]}
+
+    assert _can_stream_copy(probe_result) is False
+
+def test_can_stream_copy_accepts_conforming_input():
+    probe_result = {"streams": [dict(CONFORMING_VIDEO_STREAM), {"codec_type": "audio", "codec_name": "aac"}]}
+
+    assert _can_stream_copy(probe_result) is True
+
+@pytest.mark.asyncio
+async def test_probe_cached_by_path_mtime_and_size(dummy_mp4_file: Path, monkeypatch):
+    """A second probe of an unchanged file is served from the cache; a changed file is re-probed."""
+    monkeypatch.setattr(hls_packager, "_probe_cache", type(hls_packager._probe_cache)())
+    mock_process = AsyncMock()
+    mock_process.communicate = AsyncMock(return_value=(b'{"streams": []}', None))
+    mock_process.returncode = 0
+
+    with (
+        patch("shutil.which", return_value="/fake/path/to/ffprobe"),
+        patch("asyncio.create_subprocess_exec", return_value=mock_process) as mock_create_subprocess,
+    ):
+        assert await _probe(dummy_mp4_file) == {"streams": []}
+        assert await _probe(dummy_mp4_file) == {"streams": []}
+        assert mock_create_subprocess.call_count == 1 # Hit
+
+        dummy_mp4_file.write_bytes(DUMMY_MP4_BYTES * 2)
+        await _probe(dummy_mp4_file)
+        assert mock_create_subprocess.call_count == 2 # Size changed: miss
+
+        stat_result = dummy_mp4_file.stat()
+        os.utime(dummy_mp4_file, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns + 1_000_000))
+        await _probe(dummy_mp4_file)
+        assert mock_create_subprocess.call_count == 3 # mtime changed: miss
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "encoder_env, expected_encoder, expected_preset, expects_hwaccel",
+    [
+        ("libx264", "libx264", "veryfast", False),
+        ("h264_nvenc", "h264_nvenc", "p4", True),
+        ("h264_videotoolbox", "h264_videotoolbox", None, True),
+        ("libx265", "libx264", "veryfast", False), # Unsupported: falls back to libx264
+    ],
+)
+async def test_package_to_hls_encoder_argv(
+    dummy_mp4_file: Path, tmp_path: Path, monkeypatch,
+    encoder_env: str, expected_encoder: str, expected_preset, expects_hwaccel: bool,
+):
+    """HLS_VIDEO_ENCODER picks the -c:v encoder, its -preset, and whether -hwaccel auto is added."""
+    monkeypatch.setenv("HLS_VIDEO_ENCODER", encoder_env)
+    monkeypatch.setattr(hls_packager, "HLS_VIDEO_ENCODER", hls_packager._resolve_video_encoder())
+
+    mock_process = AsyncMock()
+    mock_process.communicate = AsyncMock(return_value=(None, b""))
+    mock_process.returncode = 0
+    with (
+        patch("shutil.which", return_value="/fake/path/to/ffmpeg"),
+        patch("asyncio.create_subprocess_exec", return_value=mock_process) as mock_create_subprocess,
+        patch("app.workers.hls_packager._probe", AsyncMock(return_value=None)),
+    ):
+        await package_to_hls(dummy_mp4_file, tmp_path / "out")
+
+    args = list(mock_create_subprocess.call_args.args)
+    assert args[args.index("-c:v") + 1] == expected_encoder
+    if expected_preset:
+        assert args[args.index("-preset") + 1] == expected_preset
+    else:
+        assert "-preset" not in args
+    if expects_hwaccel:
+        assert args[args.index("-hwaccel") + 1] == "auto"
+        assert args.index("-hwaccel") < args.index("-i") # An input option, so it must precede -i
+    else:
+        assert "-hwaccel" not in args
@@ -0,0 +1,78 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.utils.retry import retry_backoff
+
+class FlakyError(Exception):
+    pass
+
+def make_flaky(failures: int, is_async: bool):
+    """A callable that raises FlakyError `failures` times, then returns "ok"."""
+    side_effect = [FlakyError()] * failures + ["ok"]
+    return AsyncMock(side_effect=side_effect) if is_async else MagicMock(side_effect=side_effect)
+
+async def call(wrapped, is_async: bool):
+    return await wrapped() if is_async else wrapped()
+
+@pytest.fixture(params=[False, True], ids=["sync", "async"])
+def mode(request):
+    """Yields (is_async, sleep mock) with the matching sleep patched out."""
+    is_async = request.param
+    target = "app.utils.retry.asyncio.sleep" if is_async else "app.utils.retry.time.sleep"
+    with patch(target, new_callable=AsyncMock if is_async else MagicMock) as mock_sleep:
+        yield is_async, mock_sleep
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("failures", [0, 1, 3])
+async def test_retry_backoff_succeeds_after_failures(mode, failures: int):
+    is_async, mock_sleep = mode
+    fn = make_flaky(failures, is_async)
+    wrapped = retry_backoff(errors=(FlakyError,), max_retries=4, first_wait=1.0, jitter=False)(fn)
+
+    assert await call(wrapped, is_async) == "ok"
+    assert fn.call_count == failures + 1
+    assert [c.args[0] for c in mock_sleep.call_args_list] == [1.0, 2.0, 4.0][:failures]
+
+@pytest.mark.asyncio
+async def test_retry_backoff_reraises_after_max_retries(mode):
+    is_async, mock_sleep = mode
+    fn = make_flaky(5, is_async)
+    wrapped = retry_backoff(errors=(FlakyError,), max_retries=3, first_wait=0.5, jitter=False)(fn)
+
+    with pytest.raises(FlakyError):
+        await call(wrapped, is_async)
+    assert fn.call_count == 3
+    assert [c.args[0] for c in mock_sleep.call_args_list] == [0.5, 1.0] # No wait after the last attempt
+
+@pytest.mark.asyncio
+async def test_retry_backoff_jitter_within_ten_percent(mode):
+    is_async, mock_sleep = mode
+    fn = make_flaky(4, is_async)
+    wrapped = retry_backoff(errors=(FlakyError,), max_retries=5, first_wait=1.0, jitter=True)(fn)
+
+    await call(wrapped, is_async)
+
+    waits = [c.args[0] for c in mock_sleep.call_args_list]
+    for wait, base in zip(waits, [1.0, 2.0, 4.0, 8.0], strict=True):
+        assert base <= wait <= base * 1.1
+
+@pytest.mark.asyncio
+async def test_retry_backoff_does_not_retry_unlisted_errors(mode):
+    is_async, mock_sleep = mode
+    fn = AsyncMock(side_effect=ValueError()) if is_async else MagicMock(side_effect=ValueError())
+    wrapped = retry_backoff(errors=(FlakyError,), max_retries=3)(fn)
+
+    with pytest.raises(ValueError):
+        await call(wrapped, is_async)
+    assert fn.call_count == 1
+    mock_sleep.assert_not_called()
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("max_retries", [0, -1])
+async def test_retry_backoff_non_positive_max_retries_never_calls(mode, max_retries: int):
+    is_async, _ = mode
+    fn = make_flaky(0, is_async)
+    wrapped = retry_backoff(max_retries=max_retries)(fn)
+
+    assert await call(wrapped, is_async) is None
+    fn.assert_not_called()
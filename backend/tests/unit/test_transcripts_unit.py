@@ -1,7 +1,19 @@
 import asyncio, pytest
 from pathlib import Path
 from types import SimpleNamespace
-from app.workers import transcripts  # backend/app/workers/transcripts.py
+from unittest.mock import patch
+
+# Deterministic token counts: 1 token per word.
+WORD_ENCODER = SimpleNamespace(
+    encode_ordinary=lambda s: s.split(),          # returns list of "tokens"
+    encode_ordinary_batch=lambda texts: [s.split() for s in texts],
+    decode=lambda t: " ".join(t),
+)
+
+# transcripts loads its tiktoken encoding at import, which downloads the BPE file on first use.
+# None of these tests need the real encoding, so import it with the stub to collect offline too.
+with patch("tiktoken.encoding_for_model", return_value=WORD_ENCODER):
+    from app.workers import transcripts  # backend/app/workers/transcripts.py
 
 # ---------- fixtures & helpers ----------
 
@@ -10,34 +22,37 @@ def monkeypatched_encoder(monkeypatch):
     """
     Make token counts deterministic: 1 token per word.
     """
-    monkeypatch.setattr(
-        transcripts,
-        "ENCODER",
-        SimpleNamespace(
-            encode=lambda s: s.split(),          # returns list of "tokens"
-            decode=lambda t: " ".join(t),
-        ),
-    )
+    monkeypatch.setattr(transcripts, "ENCODER", WORD_ENCODER)
+
+@pytest.fixture(autouse=True)
+def clear_captions_cache():
+    transcripts.fetch_captions.cache_clear()
+    yield
+    transcripts.fetch_captions.cache_clear()
 
 # ---------- tests ----------
 
 def test_chunk_empty(monkeypatched_encoder):
-    assert transcripts.chunk("") == []
+    assert list(transcripts.chunk("")) == []
 
 def test_chunk_single_chunk(monkeypatched_encoder):
     txt = "word " * 50  # 50 tokens < max_tokens=400
-    chunks = transcripts.chunk(txt)
+    chunks = list(transcripts.chunk(txt))
     assert len(chunks) == 1
     assert chunks[0].text.strip() == txt.strip()
 
 def test_chunk_overlap(monkeypatched_encoder):
     txt = "word " * 850    # 850 tokens
-    chunks = transcripts.chunk(txt, max_tokens=400, overlap=50)
+    chunks = list(transcripts.chunk(txt, max_tokens=400, overlap=50))
     # expected: ceil((850	400)/(400	50)) + 1  == 3
     assert len(chunks) == 3
     # overlap check: second chunk starts at 350th token
     assert chunks[1].start_sec == int(350/3.2)
 
+def test_chunk_batch_matches_chunk(monkeypatched_encoder):
+    texts = ["word " * 850, "", "word " * 50]
+    assert transcripts.chunk_batch(texts) == [list(transcripts.chunk(t)) for t in texts]
+
 @pytest.mark.asyncio
 async def test_fetch_captions_success(monkeypatch):
     def fake_get(video_id, languages):
@@ -50,6 +65,22 @@ async def test_fetch_captions_success(monkeypatch):
     result = await transcripts.fetch_captions("abc123")
     assert result == "hello world"
 
+@pytest.mark.asyncio
+async def test_fetch_captions_cached_per_video(monkeypatch):
+    calls = []
+    def fake_get(video_id, languages):
+        calls.append(video_id)
+        return [{"text": video_id}]
+    monkeypatch.setattr(
+        transcripts.YouTubeTranscriptApi,
+        "get_transcript",
+        fake_get,
+    )
+    assert await transcripts.fetch_captions("abc123") == "abc123"
+    assert await transcripts.fetch_captions("abc123") == "abc123"
+    assert await transcripts.fetch_captions("xyz789") == "xyz789"
+    assert calls == ["abc123", "xyz789"]
+
 @pytest.mark.asyncio
 async def test_fetch_captions_no_transcript(monkeypatch):
     from youtube_transcript_api._errors import NoTranscriptFound
@@ -65,3 +96,22 @@ async def test_fetch_captions_no_transcript(monkeypatch):
     )
     result = await transcripts.fetch_captions("def456")
     assert result == ""  # empty string triggers skip logic
+
+@pytest.mark.asyncio
+async def test_fetch_captions_bulk_keeps_order_and_errors(monkeypatch):
+    def fake_get(video_id, languages):
+        if video_id == "broken":
+            raise ValueError("boom")
+        return [{"text": video_id}]
+    monkeypatch.setattr(
+        transcripts.YouTubeTranscriptApi,
+        "get_transcript",
+        fake_get,
+    )
+    async def no_sleep(_):
+        return None
+    monkeypatch.setattr(transcripts.asyncio, "sleep", no_sleep)  # skip retry back-off waits
+    results = await transcripts.fetch_captions_bulk(["a", "broken", "c"], concurrency=2)
+    assert results[0] == "a"
+    assert isinstance(results[1], ValueError)
+    assert results[2] == "c"
@@ -1,14 +1,20 @@
 import asyncio
-import os
 from pathlib import Path
-import tempfile
 import pytest
-from unittest.mock import patch, MagicMock, AsyncMock, call
-import shutil
+from unittest.mock import patch, MagicMock, AsyncMock, ANY, call
 
 # Adjust the import path based on your project structure
-from app.workers.uploader import upload_dir_to_r2, _upload_boto3_task # Import the sync task for direct testing if needed
-from botocore.exceptions import ClientError, NoCredentialsError
+from app.workers.uploader import upload_dir_to_r2, _upload_boto3_task, _get_r2_client, _get_session, get_r2_config, _is_retryable, _run_in_upload_executor, R2_UPLOAD_CONCURRENCY, TRANSFER_CONFIG, INITIAL_BACKOFF_SECONDS, MAX_BACKOFF_SECONDS, HLS_MIME_TYPES, DEFAULT_CONTENT_TYPE, _content_type_for, _iter_files, _local_etag, UploadTimeoutError # Import the sync task for direct testing if needed
+from botocore.exceptions import ClientError, EndpointConnectionError, NoCredentialsError, ParamValidationError
+
+@pytest.fixture(autouse=True)
+def clear_r2_client_cache():
+    """R2 config and client are cached per process; each test sets its own env and patches Session.client."""
+    for cached in (get_r2_config, _get_r2_client, _get_session):
+        cached.cache_clear()
+    yield
+    for cached in (get_r2_config, _get_r2_client, _get_session):
+        cached.cache_clear()
 
 @pytest.fixture
 def mock_env_vars(monkeypatch):
@@ -21,17 +27,14 @@ def mock_env_vars(monkeypatch):
     return monkeypatch # Return for potential further modification in tests
 
 @pytest.fixture
-def temp_hls_directory() -> Path:
-    """Creates a temporary directory with dummy HLS files."""
-    with tempfile.TemporaryDirectory(prefix="test_hls_upload_src_") as tmp_dir_str:
-        tmp_dir = Path(tmp_dir_str)
-        (tmp_dir / "master.m3u8").write_text("master manifest content")
-        (tmp_dir / "v0_00000.ts").write_text("segment 0 content")
-        (tmp_dir / "v0_00001.ts").write_text("segment 1 content")
-        (tmp_dir / "subdir").mkdir()
-        (tmp_dir / "subdir" / "v1_00000.ts").write_text("variant segment content")
-        yield tmp_dir
-        # shutil.rmtree(tmp_dir_str) # tempfile.TemporaryDirectory handles cleanup
+def temp_hls_directory(tmp_path: Path) -> Path:
+    """Creates a temporary directory with dummy HLS files (pytest removes tmp_path, even on failure)."""
+    (tmp_path / "master.m3u8").write_text("master manifest content")
+    (tmp_path / "v0_00000.ts").write_text("segment 0 content")
+    (tmp_path / "v0_00001.ts").write_text("segment 1 content")
+    (tmp_path / "subdir").mkdir()
+    (tmp_path / "subdir" / "v1_00000.ts").write_text("variant segment content")
+    return tmp_path
 
 @pytest.mark.asyncio
 async def test_upload_dir_to_r2_success(mock_env_vars, temp_hls_directory: Path):
@@ -42,10 +45,12 @@ async def test_upload_dir_to_r2_success(mock_env_vars, temp_hls_directory: Path)
     mock_s3_client_instance = MagicMock()
     # mock_s3_client_instance.upload_file = MagicMock() # This will be called via to_thread
 
-    with patch("boto3.client", return_value=mock_s3_client_instance) as mock_boto_client,
-         patch("app.workers.uploader.asyncio.to_thread") as mock_to_thread:
+    with (
+        patch("boto3.session.Session.client", return_value=mock_s3_client_instance) as mock_boto_client,
+        patch("app.workers.uploader._run_in_upload_executor") as mock_to_thread,
+    ):
         
-        # Make to_thread execute the first arg (the function) immediately for testing
+        # Make the executor hop execute the first arg (the function) immediately for testing
         async def fake_to_thread(func, *args, **kwargs):
             return func(*args, **kwargs)
         mock_to_thread.side_effect = fake_to_thread
@@ -57,26 +62,318 @@ async def test_upload_dir_to_r2_success(mock_env_vars, temp_hls_directory: Path)
             aws_access_key_id="test_r2_key",
             aws_secret_access_key="test_r2_secret",
             endpoint_url="https://test.r2.endpoint.com",
+            config=ANY,
         )
+        assert mock_boto_client.call_args.kwargs["config"].max_pool_connections == R2_UPLOAD_CONCURRENCY
+
+        # A second publish reuses the cached client rather than building a new one
+        with patch("app.workers.uploader._run_in_upload_executor", AsyncMock()) as mock_second_publish:
+            await upload_dir_to_r2(temp_hls_directory, remote_prefix)
+        mock_boto_client.assert_called_once()
+        # ...and that one client is what every upload thread gets
+        for c in mock_to_thread.call_args_list + mock_second_publish.call_args_list:
+            assert c.args[1] is mock_s3_client_instance
         
         assert mock_to_thread.call_count == 4 # master.m3u8, 2 .ts files, 1 subdir .ts file
 
+        # Files are uploaded in relative-path order, master.m3u8 last, and with an executor that
+        # returns at once each task reaches its executor call in creation order
         expected_calls = [
-            call(_upload_boto3_task, mock_s3_client_instance, str(temp_hls_directory / "master.m3u8"), "test-bucket", f"{remote_prefix}/master.m3u8", "application/vnd.apple.mpegurl"),
+            call(_upload_boto3_task, mock_s3_client_instance, str(temp_hls_directory / "subdir" / "v1_00000.ts"), "test-bucket", f"{remote_prefix}/subdir/v1_00000.ts", "video/MP2T"),
             call(_upload_boto3_task, mock_s3_client_instance, str(temp_hls_directory / "v0_00000.ts"), "test-bucket", f"{remote_prefix}/v0_00000.ts", "video/MP2T"),
             call(_upload_boto3_task, mock_s3_client_instance, str(temp_hls_directory / "v0_00001.ts"), "test-bucket", f"{remote_prefix}/v0_00001.ts", "video/MP2T"),
-            call(_upload_boto3_task, mock_s3_client_instance, str(temp_hls_directory / "subdir" / "v1_00000.ts"), "test-bucket", f"{remote_prefix}/subdir/v1_00000.ts", "video/MP2T"),
+            call(_upload_boto3_task, mock_s3_client_instance, str(temp_hls_directory / "master.m3u8"), "test-bucket", f"{remote_prefix}/master.m3u8", "application/vnd.apple.mpegurl"),
         ]
-        # Order of rglob can vary, so check calls without specific order if necessary, or sort paths before iterating in uploader
-        # For now, let's assume a consistent order or check for presence of calls
-        actual_calls = mock_to_thread.call_args_list
-        # A more robust check if order is not guaranteed:
-        # self.assertCountEqual([c[0][1:] for c in actual_calls], [exp[0][1:] for exp in expected_calls])
-        # For simplicity, if the number of calls is right, and the URL is right, it's a good sign.
-        # A more precise check would involve inspecting each call's arguments carefully.
+        mock_to_thread.assert_has_calls(expected_calls, any_order=False)
 
         assert returned_url == expected_url
 
+@pytest.mark.asyncio
+async def test_upload_dir_to_r2_content_types(mock_env_vars, tmp_path: Path):
+    """Content types come from the static HLS table, with a generic fallback for anything else."""
+    (tmp_path / "master.m3u8").write_text("master manifest content")
+    (tmp_path / "init.MP4").write_text("init segment")
+    (tmp_path / "subs_en.vtt").write_text("WEBVTT")
+    (tmp_path / "notes.unknownext").write_text("not an HLS file")
+    (tmp_path / "v1.ts").mkdir()
+    (tmp_path / "v1.ts" / "README").write_text("no extension, dotted parent dir")
+
+    with (
+        patch("boto3.session.Session.client", return_value=MagicMock()),
+        patch("app.workers.uploader._run_in_upload_executor", AsyncMock()) as mock_to_thread,
+    ):
+        await upload_dir_to_r2(tmp_path, "prefix")
+
+    content_types = {c.args[4]: c.args[5] for c in mock_to_thread.call_args_list}
+    assert content_types == {
+        "prefix/master.m3u8": "application/vnd.apple.mpegurl",
+        "prefix/init.MP4": "video/mp4",
+        "prefix/subs_en.vtt": "text/vtt",
+        "prefix/notes.unknownext": "application/octet-stream",
+        "prefix/v1.ts/README": "application/octet-stream",
+    }
+
+@pytest.mark.asyncio
+async def test_upload_dir_to_r2_respects_concurrency_limit(mock_env_vars, monkeypatch, tmp_path: Path):
+    """No more than R2_UPLOAD_CONCURRENCY uploads are in flight at once."""
+    monkeypatch.setattr("app.workers.uploader.R2_UPLOAD_CONCURRENCY", 3)
+    (tmp_path / "master.m3u8").write_text("master manifest content")
+    for i in range(10):
+        (tmp_path / f"v0_{i:05d}.ts").write_text(f"segment {i}")
+
+    in_flight = 0
+    max_in_flight = 0
+    async def slow_upload(func, *args):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+
+    with (
+        patch("boto3.session.Session.client", return_value=MagicMock()),
+        patch("app.workers.uploader._run_in_upload_executor", side_effect=slow_upload) as mock_to_thread,
+    ):
+        await upload_dir_to_r2(tmp_path, "prefix")
+
+    assert mock_to_thread.call_count == 11
+    assert max_in_flight == 3
+
+def test_iter_files_matches_rglob(temp_hls_directory: Path):
+    """The scandir walk finds the same files as rglob, with '/'-joined relative paths."""
+    (temp_hls_directory / "subdir" / "nested").mkdir()
+    (temp_hls_directory / "subdir" / "nested" / "v2_00000.ts").write_text("nested segment")
+    (temp_hls_directory / "empty").mkdir()
+
+    expected = sorted((str(p), p.relative_to(temp_hls_directory).as_posix()) for p in temp_hls_directory.rglob("*") if p.is_file())
+    assert sorted(_iter_files(str(temp_hls_directory))) == expected
+
+@pytest.mark.asyncio
+async def test_directory_walk_does_not_block_event_loop(mock_env_vars, tmp_path: Path):
+    """The directory walk runs in a thread, so other tasks keep running while it's slow."""
+    import time
+    (tmp_path / "master.m3u8").write_text("master manifest content")
+
+    def slow_iter_files(dir_path, rel_dir=""):
+        for i in range(5):
+            time.sleep(0.02) # A slow readdir/stat
+            yield f"{dir_path}/v0_{i:05d}.ts", f"v0_{i:05d}.ts"
+        yield f"{dir_path}/master.m3u8", "master.m3u8"
+
+    ticks = 0
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.005)
+            ticks += 1
+
+    ticker_task = asyncio.create_task(ticker())
+    try:
+        with (
+            patch("boto3.session.Session.client", return_value=MagicMock()),
+            patch("app.workers.uploader._iter_files", side_effect=slow_iter_files),
+            patch("app.workers.uploader._run_in_upload_executor", AsyncMock()) as mock_to_thread,
+        ):
+            await upload_dir_to_r2(tmp_path, "prefix")
+    finally:
+        ticker_task.cancel()
+
+    assert mock_to_thread.call_count == 6
+    assert ticks >= 5 # ~100ms of walking; the loop would get no ticks in if the walk blocked it
+
+def test_windows_style_paths_use_posix_keys(monkeypatch):
+    """S3 keys are joined with '/' by the walk itself, whatever separator the OS puts in entry paths."""
+    from contextlib import nullcontext
+    from types import SimpleNamespace
+
+    def entry(parent, name, is_dir=False):
+        return SimpleNamespace(name=name, path=f"{parent}\\{name}", is_dir=lambda follow_symlinks=True: is_dir, is_file=lambda: not is_dir)
+
+    tree = {
+        "C:\\hls": [entry("C:\\hls", "master.m3u8"), entry("C:\\hls", "v1", is_dir=True)],
+        "C:\\hls\\v1": [entry("C:\\hls\\v1", "v1_00000.ts")],
+    }
+    monkeypatch.setattr("app.workers.uploader.os.scandir", lambda path: nullcontext(tree[path]))
+
+    assert sorted(_iter_files("C:\\hls")) == [
+        ("C:\\hls\\master.m3u8", "master.m3u8"),
+        ("C:\\hls\\v1\\v1_00000.ts", "v1/v1_00000.ts"),
+    ]
+
+@pytest.mark.asyncio
+async def test_session_reused_across_files(mock_env_vars, temp_hls_directory: Path):
+    """One Session and one client serve every file of every publish, so pooled connections stay warm."""
+    with (
+        patch("app.workers.uploader.boto3.session.Session") as mock_session_cls,
+        patch("app.workers.uploader._run_in_upload_executor", AsyncMock()) as mock_to_thread,
+    ):
+        for _ in range(10):
+            await upload_dir_to_r2(temp_hls_directory, "prefix")
+
+    mock_session_cls.assert_called_once_with()
+    mock_session_cls.return_value.client.assert_called_once()
+    assert mock_to_thread.call_count == 10 * 4
+    assert {c.args[1] for c in mock_to_thread.call_args_list} == {mock_session_cls.return_value.client.return_value}
+
+@pytest.mark.parametrize("suffix, content_type", HLS_MIME_TYPES.items())
+def test_content_type_mapping(suffix, content_type):
+    assert _content_type_for(f"subdir/file{suffix}") == content_type
+    assert _content_type_for(f"file{suffix.upper()}") == content_type
+
+@pytest.mark.parametrize("relative_path", ["README", "file.unknownext", "v1.ts/README", "file."])
+def test_content_type_fallback(relative_path):
+    assert _content_type_for(relative_path) == DEFAULT_CONTENT_TYPE
+
+@pytest.mark.asyncio
+async def test_run_in_upload_executor_uses_upload_threads():
+    import threading
+    thread_name = await _run_in_upload_executor(lambda: threading.current_thread().name)
+    assert thread_name.startswith("r2-upload")
+
+@pytest.mark.asyncio
+async def test_upload_executor_isolated_from_default_pool():
+    """Uploads don't queue behind other work holding the loop's default executor (to_thread, stat, rmtree...)."""
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    loop = asyncio.get_running_loop()
+    # There's no public getter, and set_default_executor() won't take None back, so the previous
+    # default (often None, i.e. not created yet) is saved and restored through the attribute.
+    original_default = loop._default_executor
+    default_pool = ThreadPoolExecutor(max_workers=1)
+    loop.set_default_executor(default_pool)
+    release = threading.Event()
+    try:
+        blocked = loop.run_in_executor(None, release.wait) # Default pool is now fully busy
+        try:
+            result = await asyncio.wait_for(_run_in_upload_executor(lambda: "uploaded"), timeout=1)
+        finally:
+            release.set()
+            await blocked
+    finally:
+        loop._default_executor = original_default
+        default_pool.shutdown(wait=True)
+    assert result == "uploaded"
+
+@pytest.mark.asyncio
+async def test_upload_dir_to_r2_skip_unchanged(mock_env_vars, tmp_path: Path):
+    """With skip_unchanged, files whose stored ETag matches their MD5 aren't uploaded again."""
+    import hashlib
+    (tmp_path / "master.m3u8").write_text("master manifest content")
+    (tmp_path / "v0_00000.ts").write_text("segment 0 content")
+    stored_etags = {
+        "prefix/master.m3u8": '"%s"' % hashlib.md5(b"master manifest content").hexdigest(),
+        "prefix/v0_00000.ts": '"%s"' % hashlib.md5(b"an older segment").hexdigest(),
+    }
+
+    mock_s3_client = MagicMock()
+    mock_s3_client.head_object.side_effect = lambda Bucket, Key: {"ETag": stored_etags[Key]}
+
+    async def fake_executor(func, *args):
+        return func(*args)
+
+    with (
+        patch("boto3.session.Session.client", return_value=mock_s3_client),
+        patch("app.workers.uploader._run_in_upload_executor", side_effect=fake_executor),
+    ):
+        await upload_dir_to_r2(tmp_path, "prefix", skip_unchanged=True)
+
+    assert mock_s3_client.head_object.call_count == 2
+    uploaded_keys = [c.kwargs["Key"] for c in mock_s3_client.put_object.call_args_list]
+    assert uploaded_keys == ["prefix/v0_00000.ts"]
+
+@pytest.mark.asyncio
+async def test_upload_skipped_when_multipart_etag_matches(mock_env_vars, tmp_path: Path):
+    """Files big enough for multipart are compared against the multipart ETag they'd get."""
+    import hashlib
+    (tmp_path / "master.m3u8").write_text("master manifest content")
+    segment = tmp_path / "v0_00000.ts"
+    with open(segment, "wb") as f:
+        f.truncate(20 * 1024 * 1024) # Three parts: 8MB, 8MB, 4MB of zeros
+    part_size = TRANSFER_CONFIG.multipart_chunksize
+    part_digests = b"".join(hashlib.md5(bytes(size)).digest() for size in (part_size, part_size, 20 * 1024 * 1024 - 2 * part_size))
+    stored_etags = {
+        "prefix/master.m3u8": '"%s"' % hashlib.md5(b"master manifest content").hexdigest(),
+        "prefix/v0_00000.ts": '"%s-3"' % hashlib.md5(part_digests).hexdigest(),
+    }
+
+    mock_s3_client = MagicMock()
+    mock_s3_client.head_object.side_effect = lambda Bucket, Key: {"ETag": stored_etags[Key]}
+
+    async def fake_executor(func, *args):
+        return func(*args)
+
+    with (
+        patch("boto3.session.Session.client", return_value=mock_s3_client),
+        patch("app.workers.uploader._run_in_upload_executor", side_effect=fake_executor),
+    ):
+        await upload_dir_to_r2(tmp_path, "prefix", skip_unchanged=True)
+        # An object stored with a different part size can't be matched, so it's re-uploaded
+        stored_etags["prefix/v0_00000.ts"] = '"%s-4"' % hashlib.md5(part_digests).hexdigest()
+        await upload_dir_to_r2(tmp_path, "prefix", skip_unchanged=True)
+
+    mock_s3_client.put_object.assert_not_called()
+    assert [c.args[2] for c in mock_s3_client.upload_file.call_args_list] == ["prefix/v0_00000.ts"]
+
+@pytest.mark.parametrize("part_count", [0, 7])
+def test_large_segment_hashing_memory(tmp_path: Path, part_count):
+    """Hashing a 50MB segment, single-part or multipart, streams it instead of reading it whole."""
+    import tracemalloc
+    segment = tmp_path / "v0_00000.ts"
+    with open(segment, "wb") as f:
+        f.truncate(50 * 1024 * 1024)
+
+    tracemalloc.start()
+    try:
+        etag = _local_etag(str(segment), part_count)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert etag.endswith("-7") if part_count else "-" not in etag
+    assert peak < 4 * 1024 * 1024
+
+def test_upload_boto3_task_puts_small_files_directly(tmp_path: Path):
+    """Files below the multipart threshold go up in a single put_object call."""
+    segment = tmp_path / "v0_00000.ts"
+    segment.write_bytes(b"segment data")
+    mock_s3_client = MagicMock()
+
+    _upload_boto3_task(mock_s3_client, str(segment), "test-bucket", "prefix/v0_00000.ts", "video/MP2T")
+
+    mock_s3_client.upload_file.assert_not_called()
+    mock_s3_client.put_object.assert_called_once()
+    kwargs = mock_s3_client.put_object.call_args.kwargs
+    assert kwargs["Bucket"] == "test-bucket"
+    assert kwargs["Key"] == "prefix/v0_00000.ts"
+    assert kwargs["ContentType"] == "video/MP2T"
+    assert kwargs["ContentLength"] == len(b"segment data")
+
+def test_upload_boto3_task_uses_transfer_config():
+    """Large files go through upload_file with the module's TransferConfig rather than boto3's defaults."""
+    mock_s3_client = MagicMock()
+    with patch("app.workers.uploader.os.path.getsize", return_value=TRANSFER_CONFIG.multipart_threshold):
+        _upload_boto3_task(mock_s3_client, "/tmp/v0_00000.ts", "test-bucket", "prefix/v0_00000.ts", "video/MP2T")
+    mock_s3_client.put_object.assert_not_called()
+    mock_s3_client.upload_file.assert_called_once_with(
+        "/tmp/v0_00000.ts",
+        "test-bucket",
+        "prefix/v0_00000.ts",
+        ExtraArgs={'ContentType': "video/MP2T"},
+        Config=TRANSFER_CONFIG,
+    )
+
+def test_upload_large_segment_uses_multipart(tmp_path: Path):
+    """A 20MB segment is over the 8MB threshold, so it goes through upload_file's multipart path."""
+    segment = tmp_path / "v0_00000.ts"
+    with open(segment, "wb") as f:
+        f.truncate(20 * 1024 * 1024) # Sparse, nothing is actually written
+    mock_s3_client = MagicMock()
+
+    _upload_boto3_task(mock_s3_client, str(segment), "test-bucket", "prefix/v0_00000.ts", "video/MP2T")
+
+    mock_s3_client.put_object.assert_not_called()
+    assert mock_s3_client.upload_file.call_args.kwargs["Config"].multipart_threshold == 8 * 1024 * 1024
+
 @pytest.mark.asyncio
 async def test_upload_dir_to_r2_missing_env_vars(temp_hls_directory: Path):
     """Test upload failure when R2 environment variables are missing."""
@@ -84,6 +381,18 @@ async def test_upload_dir_to_r2_missing_env_vars(temp_hls_directory: Path):
     with pytest.raises(RuntimeError, match="Missing R2 configuration. Required env vars: CF_R2_KEY, CF_R2_SECRET, CF_R2_ENDPOINT, CF_R2_BUCKET, CF_PUBLIC_CDN"):
         await upload_dir_to_r2(temp_hls_directory, "answers/test_id")
 
+def test_get_r2_config_read_once_and_hides_credentials(mock_env_vars):
+    """Settings are read and validated once per process; the credentials don't show in its repr."""
+    config = get_r2_config()
+    mock_env_vars.setenv("CF_R2_BUCKET", "another-bucket")
+    assert get_r2_config() is config
+    assert config.bucket == "test-bucket"
+    assert "test_r2_key" not in repr(config) and "test_r2_secret" not in repr(config)
+    assert "test-bucket" in repr(config)
+
+    get_r2_config.cache_clear()
+    assert get_r2_config().bucket == "another-bucket"
+
 @pytest.mark.asyncio
 async def test_upload_dir_to_r2_local_dir_not_found(mock_env_vars):
     """Test upload failure when local directory does not exist."""
@@ -93,121 +402,193 @@ async def test_upload_dir_to_r2_local_dir_not_found(mock_env_vars):
 
 @pytest.mark.asyncio
 async def test_upload_dir_to_r2_master_manifest_missing_locally(mock_env_vars, temp_hls_directory: Path):
-    """Test failure if master.m3u8 is missing locally after uploads (should not happen if packager works)."""
+    """Test failure if master.m3u8 is missing locally (should not happen if packager works); nothing is uploaded."""
     (temp_hls_directory / "master.m3u8").unlink() # Remove master manifest
     
     mock_s3_client_instance = MagicMock()
-    with patch("boto3.client", return_value=mock_s3_client_instance),
-         patch("app.workers.uploader.asyncio.to_thread", AsyncMock()): # Mock uploads to succeed
+    with (
+        patch("boto3.session.Session.client", return_value=mock_s3_client_instance),
+        patch("app.workers.uploader._run_in_upload_executor", AsyncMock()) as mock_to_thread, # Mock uploads to succeed
+    ):
         with pytest.raises(RuntimeError, match=f"master.m3u8 not found in {temp_hls_directory}, cannot form public URL."):
             await upload_dir_to_r2(temp_hls_directory, "answers/test_id")
+    mock_to_thread.assert_not_called()
+
+def make_flaky_task(failures: int):
+    """
+    Stands in for the boto3 task: master.m3u8 always uploads, every other file raises a retryable
+    SlowDown on its first `failures` attempts. Returns the task and the list of (client, path, key) it saw.
+    """
+    attempts = []
+    def task(s3_client, local_f_str, b_name, s3_k, c_type):
+        attempts.append((s3_client, local_f_str, s3_k))
+        if s3_k.endswith("master.m3u8"):
+            return
+        if sum(1 for _, _, k in attempts if k == s3_k) <= failures:
+            raise ClientError({"Error": {"Code": "SlowDown", "Message": "Details"}}, "PutObject")
+    return task, attempts
 
 @pytest.mark.asyncio
-async def test_upload_file_with_retry_success_on_first_attempt(mock_env_vars):
-    """Test _upload_file_with_retry succeeds on the first try."""
+@pytest.mark.parametrize("failures, expected_attempts, should_raise", [
+    pytest.param(0, 1, False, id="success_on_first_attempt"),
+    pytest.param(2, 3, False, id="succeeds_after_retries"),
+    pytest.param(3, 3, True, id="fails_after_max_retries"),
+])
+async def test_upload_file_with_retry(mock_env_vars, tmp_path: Path, failures, expected_attempts, should_raise):
+    """A segment is retried after each retryable failure, up to MAX_RETRIES attempts, sleeping between attempts."""
     mock_s3_client = MagicMock()
-    # mock_s3_client.upload_file = MagicMock() # Called via to_thread
-    local_file = Path(tempfile.mktemp())
-    local_file.touch()
-
-    with patch("app.workers.uploader.asyncio.to_thread") as mock_to_thread:
-        async def fake_to_thread(func, *args, **kwargs):
-            return func(*args, **kwargs)
-        mock_to_thread.side_effect = fake_to_thread
-        
-        await upload_dir_to_r2(local_file.parent, "prefix") # Using upload_dir_to_r2 to trigger internal calls
-    
-    # Check that to_thread was called once for the file
-    mock_to_thread.assert_called_once()
-    args_passed = mock_to_thread.call_args[0]
-    assert args_passed[1] == mock_s3_client # s3_client passed to _upload_boto3_task
-    assert args_passed[2] == str(local_file) # local_file_path_str
-
-    local_file.unlink()
-
-@pytest.mark.asyncio
-async def test_upload_file_with_retry_succeeds_after_retries(mock_env_vars):
-    """Test _upload_file_with_retry succeeds after a few retries."""
-    mock_s3_client_instance = MagicMock()
-    # mock_s3_client_instance.upload_file will be called by _upload_boto3_task
-    local_file = Path(tempfile.mktemp())
+    (tmp_path / "master.m3u8").write_text("master content")
+    local_file = tmp_path / "v0_00000.ts"
     local_file.write_text("dummy content")
-    bucket = "test-bucket"
     key = "prefix/" + local_file.name
-    content_type = "text/plain"
-
-    # Simulate ClientError for the first 2 calls, then success
-    # The actual upload_file is called inside the to_thread task.
-    # We need to mock the behavior of _upload_boto3_task when run by to_thread.
-    side_effect_list = [
-        ClientError({"Error": {"Code": "SomeError", "Message": "Details"}}, "operation_name"),
-        ClientError({"Error": {"Code": "SomeError", "Message": "Details"}}, "operation_name"),
-        None # Success
-    ]
+    task, attempts = make_flaky_task(failures)
+
+    mock_sleep = AsyncMock()
+    with (
+        patch("boto3.session.Session.client", return_value=mock_s3_client),
+        patch("app.workers.uploader._run_in_upload_executor", side_effect=lambda func, *args, **kwargs: task(*args)),
+        patch("app.workers.uploader.random.uniform", side_effect=lambda low, high: high / 2) as mock_uniform,
+    ):
+        if should_raise:
+            with pytest.raises(RuntimeError, match=f"Failed to upload {key} to S3 after 3 attempts"):
+                await upload_dir_to_r2(tmp_path, "prefix", sleep_fn=mock_sleep)
+        else:
+            await upload_dir_to_r2(tmp_path, "prefix", sleep_fn=mock_sleep)
+
+    segment_attempts = [(client, path) for client, path, k in attempts if k == key]
+    assert segment_attempts == [(mock_s3_client, str(local_file))] * expected_attempts
+    # master.m3u8 only goes up once the segments it references are there
+    master_attempts = [k for _, _, k in attempts if k == "prefix/master.m3u8"]
+    assert master_attempts == ([] if should_raise else ["prefix/master.m3u8"])
+    assert attempts[-1][2] == ("prefix/v0_00000.ts" if should_raise else "prefix/master.m3u8")
+    # No sleep after the final attempt, whether it succeeded or failed
+    assert mock_sleep.call_count == expected_attempts - 1
+    # Full jitter: each delay is drawn from [0, base * 2**attempt], capped, so concurrent uploads
+    # throttled together don't all retry at the same moment
+    expected_bounds = [min(MAX_BACKOFF_SECONDS, INITIAL_BACKOFF_SECONDS * 2 ** attempt) for attempt in range(1, expected_attempts)]
+    assert [c.args for c in mock_uniform.call_args_list] == [(0, bound) for bound in expected_bounds]
+    assert [c.args[0] for c in mock_sleep.call_args_list] == pytest.approx([bound / 2 for bound in expected_bounds])
 
-    async def mockable_boto_task(s3_client, local_f_str, b_name, s3_k, c_type):
-        effect = side_effect_list.pop(0)
-        if isinstance(effect, Exception):
-            raise effect
-        # Actual call would be: s3_client.upload_file(local_f_str, b_name, s3_k, ExtraArgs={'ContentType': c_type})
-        # For this mock, we just consume the effect.
-        return
-
-    with patch("boto3.client", return_value=mock_s3_client_instance),
-         patch("app.workers.uploader.asyncio.to_thread", side_effect=lambda func, *args, **kwargs: mockable_boto_task(*args)) as mock_to_thread,
-         patch("app.workers.uploader.asyncio.sleep", AsyncMock()) as mock_sleep: # Mock sleep to speed up test
-        
-        # Create master.m3u8 as it's expected by the end of upload_dir_to_r2
-        (local_file.parent / "master.m3u8").write_text("master content")
+@pytest.mark.asyncio
+async def test_upload_aborts_at_budget(mock_env_vars, monkeypatch, tmp_path: Path):
+    """A file whose attempts keep timing out gives up once retrying would overrun the budget, before MAX_RETRIES."""
+    monkeypatch.setattr("app.workers.uploader.MAX_RETRIES", 10)
+    monkeypatch.setattr("app.workers.uploader.MAX_TOTAL_RETRY_SECONDS", 60)
+    (tmp_path / "master.m3u8").write_text("master content")
+    (tmp_path / "v0_00000.ts").write_text("dummy content")
+
+    # Simulated clock (for the uploader only): each attempt at the segment takes 25s to time out,
+    # sleeps advance it too
+    from types import SimpleNamespace
+    clock = [1000.0]
+    monkeypatch.setattr("app.workers.uploader.time", SimpleNamespace(monotonic=lambda: clock[0]))
+    waits_end_at = []
+    async def fake_sleep(delay):
+        clock[0] += delay
+        waits_end_at.append(clock[0] - 1000.0)
+    mock_sleep = AsyncMock(side_effect=fake_sleep)
+
+    def mockable_boto_task_slow_timeout(s3_client, local_f_str, b_name, s3_k, c_type):
+        clock[0] += 25
+        raise EndpointConnectionError(endpoint_url="https://test.r2.endpoint.com")
+
+    with (
+        patch("boto3.session.Session.client", return_value=MagicMock()),
+        patch("app.workers.uploader._run_in_upload_executor", side_effect=lambda func, *args, **kwargs: mockable_boto_task_slow_timeout(*args)) as mock_to_thread,
+    ):
+        with pytest.raises(UploadTimeoutError, match="prefix/v0_00000.ts") as exc_info:
+            await upload_dir_to_r2(tmp_path, "prefix", sleep_fn=mock_sleep)
+
+    # Attempts end at ~25s and ~50s; after the third (~75s) no further wait fits in 60s
+    assert exc_info.value.attempts == 3
+    assert isinstance(exc_info.value, RuntimeError)
+    assert mock_to_thread.call_count == 3
+    assert mock_sleep.call_count == 2
+    assert all(end <= 60 for end in waits_end_at) # No wait was started that would end past the budget
+
+def test_is_retryable_unwraps_upload_failed_error():
+    """upload_file wraps S3 errors in S3UploadFailedError; the underlying code decides."""
+    from boto3.exceptions import S3UploadFailedError
+
+    def wrapped(code, status):
+        try:
+            raise ClientError({"Error": {"Code": code}, "ResponseMetadata": {"HTTPStatusCode": status}}, "PutObject")
+        except ClientError:
+            try:
+                raise S3UploadFailedError("Failed to upload")
+            except S3UploadFailedError as e:
+                return e
+
+    assert _is_retryable(wrapped("SlowDown", 503))
+    assert _is_retryable(wrapped("SomethingNew", 500))
+    assert not _is_retryable(wrapped("AccessDenied", 403))
+    assert not _is_retryable(wrapped("NoSuchBucket", 404))
+    assert not _is_retryable(wrapped("InvalidRequest", 400))
+    assert _is_retryable(EndpointConnectionError(endpoint_url="https://r2.example.com"))
+    assert not _is_retryable(ParamValidationError(report="bad ContentType"))
+
+@pytest.mark.asyncio
+async def test_upload_file_with_retry_propagates_local_errors_without_retrying(mock_env_vars, tmp_path: Path):
+    """Errors that don't come from S3 (here a local OSError) aren't retried or wrapped."""
+    (tmp_path / "master.m3u8").write_text("master content")
 
-        await upload_dir_to_r2(local_file.parent, "prefix")
+    def mockable_boto_task_oserror(s3_client, local_f_str, b_name, s3_k, c_type):
+        raise PermissionError(f"Permission denied: {local_f_str}")
 
-    assert mock_to_thread.call_count == 3 + 1 # 3 for the failing file, 1 for master.m3u8
-    assert mock_sleep.call_count == 2 # Called before 2nd and 3rd attempts
+    mock_sleep = AsyncMock()
+    with (
+        patch("boto3.session.Session.client", return_value=MagicMock()),
+        patch("app.workers.uploader._run_in_upload_executor", side_effect=lambda func, *args, **kwargs: mockable_boto_task_oserror(*args)) as mock_to_thread,
+    ):
+        with pytest.raises(PermissionError):
+            await upload_dir_to_r2(tmp_path, "prefix", sleep_fn=mock_sleep)
 
-    local_file.unlink()
-    (local_file.parent / "master.m3u8").unlink()
-    os.rmdir(local_file.parent)
+    assert mock_to_thread.call_count == 1
+    mock_sleep.assert_not_called()
 
 @pytest.mark.asyncio
-async def test_upload_file_with_retry_fails_after_max_retries(mock_env_vars):
-    """Test _upload_file_with_retry fails after MAX_RETRIES."""
-    mock_s3_client_instance = MagicMock()
-    local_file = Path(tempfile.mktemp())
-    local_file.write_text("dummy content")
-    bucket = "test-bucket"
-    key = "prefix/" + local_file.name
-    content_type = "text/plain"
+async def test_upload_file_with_retry_fails_fast_on_permanent_error(mock_env_vars, tmp_path: Path):
+    """A non-retryable S3 error (e.g. AccessDenied) fails on the first attempt, without sleeping."""
+    (tmp_path / "master.m3u8").write_text("master content")
 
-    # Simulate ClientError for all calls
-    async def mockable_boto_task_always_fail(s3_client, local_f_str, b_name, s3_k, c_type):
-        raise ClientError({"Error": {"Code": "SomeError", "Message": "Details"}}, "operation_name")
+    def mockable_boto_task_denied(s3_client, local_f_str, b_name, s3_k, c_type):
+        raise ClientError({"Error": {"Code": "AccessDenied", "Message": "Access Denied"}}, "PutObject")
 
-    with patch("boto3.client", return_value=mock_s3_client_instance),
-         patch("app.workers.uploader.asyncio.to_thread", side_effect=lambda func, *args, **kwargs: mockable_boto_task_always_fail(*args)) as mock_to_thread,
-         patch("app.workers.uploader.asyncio.sleep", AsyncMock()) as mock_sleep: # Mock sleep
+    mock_sleep = AsyncMock()
+    with (
+        patch("boto3.session.Session.client", return_value=MagicMock()),
+        patch("app.workers.uploader._run_in_upload_executor", side_effect=lambda func, *args, **kwargs: mockable_boto_task_denied(*args)) as mock_to_thread,
+    ):
+        with pytest.raises(RuntimeError, match="Failed to upload prefix/master.m3u8 to S3: .*AccessDenied"):
+            await upload_dir_to_r2(tmp_path, "prefix", sleep_fn=mock_sleep)
 
-        # Create master.m3u8 as it's expected by the end of upload_dir_to_r2
-        (local_file.parent / "master.m3u8").write_text("master content")
+    assert mock_to_thread.call_count == 1
+    mock_sleep.assert_not_called()
 
-        with pytest.raises(RuntimeError, match=f"Failed to upload {key} to S3 after 3 attempts"):
-            await upload_dir_to_r2(local_file.parent, "prefix")
-    
-    # MAX_RETRIES for the failing file, plus one for master.m3u8 (which would also fail in this setup)
-    # This depends on how many files are in local_file.parent. If only local_file and master.m3u8, then 3+3=6
-    # If only local_file, then 3 calls. If master.m3u8 is also processed, it will also try 3 times.
-    # The test setup for upload_dir_to_r2 will try to upload all files. Let's assume local_file.parent only has local_file and master.m3u8
-    assert mock_to_thread.call_count == 3 # Only for the first file that fails. The function will raise before processing master.m3u8 in this case.
-    assert mock_sleep.call_count == 2 # (MAX_RETRIES - 1) for the first failing file
+@pytest.mark.asyncio
+async def test_upload_file_with_retry_retries_400_request_timeout(mock_env_vars, tmp_path: Path):
+    """S3 reports an idle upload connection as a 400 RequestTimeout; unlike other 400s it's transient."""
+    (tmp_path / "master.m3u8").write_text("master content")
+    failures = [ClientError({"Error": {"Code": "RequestTimeout", "Message": "Your socket connection to the server was not read from or written to within the timeout period."}, "ResponseMetadata": {"HTTPStatusCode": 400}}, "PutObject")]
+
+    def mockable_boto_task_timeout_once(s3_client, local_f_str, b_name, s3_k, c_type):
+        if failures:
+            raise failures.pop()
+
+    mock_sleep = AsyncMock()
+    with (
+        patch("boto3.session.Session.client", return_value=MagicMock()),
+        patch("app.workers.uploader._run_in_upload_executor", side_effect=lambda func, *args, **kwargs: mockable_boto_task_timeout_once(*args)) as mock_to_thread,
+    ):
+        await upload_dir_to_r2(tmp_path, "prefix", sleep_fn=mock_sleep)
 
-    local_file.unlink()
-    (local_file.parent / "master.m3u8").unlink()
-    os.rmdir(local_file.parent)
+    assert mock_to_thread.call_count == 2
+    assert mock_sleep.call_count == 1
 
 @pytest.mark.asyncio
 async def test_upload_dir_to_r2_boto3_no_credentials_error(mock_env_vars, temp_hls_directory: Path):
     """Test NoCredentialsError when creating boto3 client."""
-    with patch("boto3.client", side_effect=NoCredentialsError()) as mock_boto_client:
+    with patch("boto3.session.Session.client", side_effect=NoCredentialsError()) as mock_boto_client:
         with pytest.raises(RuntimeError, match="AWS credentials not found or incomplete for R2 upload."):
             await upload_dir_to_r2(temp_hls_directory, "answers/test_id")
         mock_boto_client.assert_called_once()
@@ -215,7 +596,7 @@ async def test_upload_dir_to_r2_boto3_no_credentials_error(mock_env_vars, temp_h
 @pytest.mark.asyncio
 async def test_upload_dir_to_r2_boto3_generic_client_creation_error(mock_env_vars, temp_hls_directory: Path):
     """Test generic error when creating boto3 client."""
-    with patch("boto3.client", side_effect=Exception("Generic client error")) as mock_boto_client:
+    with patch("boto3.session.Session.client", side_effect=Exception("Generic client error")) as mock_boto_client:
         with pytest.raises(RuntimeError, match="Error creating S3 client for R2: Generic client error"):
             await upload_dir_to_r2(temp_hls_directory, "answers/test_id")
         mock_boto_client.assert_called_once()